@@ -1,13 +1,51 @@
 import os
 import pandas as pd
+import openpyxl
 import requests
 import threading
-import tkinter as tk
 import time
 import random
-from tkinter import filedialog, messagebox, scrolledtext, ttk
-from PIL import Image
+import sys
+import queue
+import glob
+import multiprocessing
+import asyncio
+import sqlite3
+import hashlib
+import shutil
+import io
+import json
+import csv
+import bisect
+import errno
+import tempfile
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from urllib.request import pathname2url
+from requests.adapters import HTTPAdapter
+from PIL import Image, UnidentifiedImageError
 import webbrowser
+import argparse
+
+# Без tkinter (серверы без дисплея) модуль работает из командной строки
+try:
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, scrolledtext, ttk
+except ImportError:
+    tk = None
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2
+except ImportError:
+    h2 = None
 
 # ---------- HTTP Session ----------
 session = requests.Session()
@@ -20,14 +58,2087 @@ session.headers.update({
     ),
     "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
     "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
-    "Cache-Control": "no-cache",
-    "Pragma": "no-cache",
     "Connection": "keep-alive"
 })
 
+# Для безусловных запросов; условные (If-None-Match) должны уметь получить 304
+NO_CACHE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Pragma": "no-cache"
+}
+
+# Параллельная загрузка: всего потоков и одновременных запросов к одному хосту
+MAX_WORKERS = 16
+PER_HOST_LIMIT = 4
+# Для asyncio-бэкенда запросов в полете может быть гораздо больше
+ASYNC_MAX_IN_FLIGHT = 256
+# С HTTP/2 запросы к хосту идут потоками поверх его PER_HOST_LIMIT соединений:
+# хосту, ответившему по HTTP/2, asyncio-бэкенд шлет до стольких запросов сразу
+ASYNC_STREAMS_PER_HOST = 32
+# Файлы пишутся на диск кусками, слишком большие обрываются
+CHUNK_SIZE = 256 * 1024
+MAX_PHOTO_BYTES = 100 * 1024 * 1024
+# Конвейер: до SPOOL_BYTES тело держится в памяти до потока записи,
+# очереди между этапами ограничены, чтобы медленный этап не раздувал память
+SPOOL_BYTES = 2 * 1024 * 1024
+READ_QUEUE_SIZE = 1000
+WRITE_QUEUE_SIZE = 64
+WRITER_THREADS = 4
+POST_WORKERS = os.cpu_count() or 2
+# Как часто писать в лог глубину очередей, сек
+PIPELINE_LOG_EVERY = 5
+
+
+def configure_session(max_workers=MAX_WORKERS, per_host_limit=PER_HOST_LIMIT):
+    # pool_connections — сколько хостов держим в пуле, pool_maxsize — соединений на хост
+    adapter = HTTPAdapter(
+        pool_connections=max(10, max_workers),
+        pool_maxsize=max(1, per_host_limit)
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+
+configure_session()
+
+
+# --- Ограничение скорости по хостам ---
+THROTTLE_STATUSES = (403, 429, 503)
+# Сколько успешных ответов подряд нужно, чтобы снова ускориться
+RAMP_UP_AFTER = 10
+# Выше этой скорости (запросов/сек) хост снова считается неограниченным
+UNLIMITED_RATE = 50.0
+MIN_RATE = 1 / 60
+MAX_RETRY_AFTER = 600
+
+
+def _parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class HostRateLimiter:
+    """Token bucket на каждый хост, скорость подстраивается под ответы сервера.
+
+    Пока хост отвечает нормально, запросы к нему не ограничиваются (или идут
+    со скоростью base_rate). После 403/429/503 между запросами появляется
+    пауза delay_seconds, которая удваивается при повторных блокировках и
+    постепенно сокращается после серии успешных ответов.
+    """
+
+    def __init__(self, delay_seconds=3, random_delay=False, base_rate=None):
+        self.delay_seconds = max(0.1, delay_seconds)
+        self.jitter = 0.3 if random_delay else 0.0
+        self.base_rate = base_rate
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _state(self, host, now):
+        state = self._hosts.get(host)
+        if state is None:
+            state = {"rate": self.base_rate, "tokens": 1.0, "updated": now,
+                     "blocked_until": 0.0, "throttled_at": None, "streak": 0}
+            self._hosts[host] = state
+        return state
+
+    def _refill(self, state, now):
+        if state["rate"] is not None:
+            burst = max(1.0, state["rate"])
+            state["tokens"] = min(burst, state["tokens"] + (now - state["updated"]) * state["rate"])
+        state["updated"] = now
+
+    def wait_time(self, host):
+        """Сколько секунд осталось до следующего разрешенного запроса к хосту."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(host, now)
+            if now < state["blocked_until"]:
+                return state["blocked_until"] - now
+            if state["rate"] is None:
+                return 0.0
+            self._refill(state, now)
+            if state["tokens"] >= 1:
+                return 0.0
+            return (1 - state["tokens"]) / state["rate"]
+
+    def acquire(self, host):
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(host, now)
+            if state["rate"] is None:
+                return
+            self._refill(state, now)
+            # случайная "цена" запроса дает неравномерные интервалы
+            state["tokens"] -= random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def feedback(self, host, status, retry_after=None):
+        """Учитывает ответ сервера. Возвращает новую паузу, если хост замедлен."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(host, now)
+            self._refill(state, now)
+
+            if status in THROTTLE_STATUSES:
+                state["streak"] = 0
+                if state["rate"] is None or state["rate"] > 1 / self.delay_seconds:
+                    state["rate"] = 1 / self.delay_seconds
+                elif state["throttled_at"] is None or now - state["throttled_at"] >= 1 / state["rate"]:
+                    # ответы на запросы, ушедшие одновременно, считаем одной блокировкой
+                    state["rate"] = max(MIN_RATE, state["rate"] / 2)
+                state["throttled_at"] = now
+                state["tokens"] = 0.0
+                pause = 1 / state["rate"]
+                if retry_after is not None:
+                    pause = max(pause, min(retry_after, MAX_RETRY_AFTER))
+                state["blocked_until"] = max(state["blocked_until"], now + pause)
+                return pause
+
+            if status is None or status >= 400 or state["rate"] is None:
+                return None
+
+            state["streak"] += 1
+            if state["streak"] >= RAMP_UP_AFTER:
+                state["streak"] = 0
+                state["rate"] *= 1.5
+                ceiling = self.base_rate if self.base_rate is not None else UNLIMITED_RATE
+                if state["rate"] >= ceiling:
+                    state["rate"] = self.base_rate
+            return None
+
+
+# --- Метрики этапов загрузки ---
+# Границы корзин гистограмм, мс
+METRIC_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+STAGE_NAMES = {
+    "connect": "соединение",
+    "tls": "TLS",
+    "ttfb": "ответ",
+    "body": "тело",
+    "write": "запись",
+    "decode": "декодирование",
+    "encode": "кодирование",
+    "post": "обработка",
+}
+
+
+class Histogram:
+    """Счетчики по корзинам METRIC_BUCKETS_MS плюс сумма и максимум."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(METRIC_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(METRIC_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """Верхняя граница корзины, в которую попадает q-я доля значений."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(METRIC_BUCKETS_MS, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 1) if self.count else None,
+            "p50_ms": round(self.percentile(0.5), 1) if self.count else None,
+            "p95_ms": round(self.percentile(0.95), 1) if self.count else None,
+            "max_ms": round(self.max, 1),
+            "buckets_ms": dict(zip([str(b) for b in METRIC_BUCKETS_MS] + ["inf"], self.counts)),
+        }
+
+
+class StageMetrics:
+    """Гистограммы длительности этапов по хостам: соединение и TLS (asyncio),
+    ответ (до заголовков), тело, запись на диск, декодирование и кодирование.
+
+    observe() вызывается из потоков загрузки и записи, поэтому под блокировкой.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, stage, seconds, host="*"):
+        with self._lock:
+            histogram = self._histograms.get((stage, host))
+            if histogram is None:
+                histogram = self._histograms[(stage, host)] = Histogram()
+            histogram.add(seconds * 1000)
+
+    def by_stage(self):
+        stages = {}
+        with self._lock:
+            for (stage, host), histogram in self._histograms.items():
+                stages.setdefault(stage, Histogram()).merge(histogram)
+        return {stage: stages[stage] for stage in STAGE_NAMES if stage in stages}
+
+    def by_host(self, stage):
+        with self._lock:
+            return {host: h for (name, host), h in self._histograms.items() if name == stage}
+
+    def summary_line(self):
+        """"ответ p50 45 мс / p95 120 мс · тело ..." — для окна и периодического лога."""
+        return " · ".join(
+            f"{STAGE_NAMES[stage]} p50 {h.percentile(0.5):.0f} / p95 {h.percentile(0.95):.0f} мс"
+            for stage, h in self.by_stage().items()
+        )
+
+    def log_summary(self, log_callback, slowest_hosts=5):
+        for stage, h in self.by_stage().items():
+            log_callback(
+                f"⏱ {STAGE_NAMES[stage]}: {h.count} раз, среднее {h.total / h.count:.0f} мс, "
+                f"p50 {h.percentile(0.5):.0f} мс, p95 {h.percentile(0.95):.0f} мс, максимум {h.max:.0f} мс"
+            )
+        hosts = sorted(self.by_host("ttfb").items(), key=lambda item: -item[1].percentile(0.95))
+        if len(hosts) > 1:
+            for host, h in hosts[:slowest_hosts]:
+                log_callback(f"🐌 {host}: ответ p95 {h.percentile(0.95):.0f} мс ({h.count} запросов)")
+
+    def export(self, path):
+        with self._lock:
+            hosts = {}
+            for (stage, host), histogram in self._histograms.items():
+                hosts.setdefault(host, {})[stage] = histogram.to_dict()
+        data = {
+            "buckets_ms": list(METRIC_BUCKETS_MS),
+            "stages": {stage: h.to_dict() for stage, h in self.by_stage().items()},
+            "hosts": hosts,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def _observe(metrics, stage, started, host="*"):
+    """Записывает время с started (perf_counter) до сейчас, если метрики включены."""
+    if metrics is not None:
+        metrics.observe(stage, time.perf_counter() - started, host)
+
+
+# --- Повторы после временных ошибок ---
+class InvalidImageError(Exception):
+    """Сервер ответил 200, но прислал не фото: страницу с капчей, пустой или обрезанный файл.
+
+    markup — пришла страница (HTML, JSON): обычно это блокировка, хост стоит притормозить.
+    retryable — повтор может помочь: страница (блокировка снимется) или тело
+    оборвалось. Файл не в том формате или без декодера (HEIC без плагина)
+    придет таким же, его не повторяют.
+    """
+
+    def __init__(self, reason, markup=False, retryable=None):
+        super().__init__(reason)
+        self.markup = markup
+        self.retryable = markup if retryable is None else retryable
+        self.quarantine_path = None
+
+    def __str__(self):
+        reason = super().__str__()
+        return f"{reason}; сохранено в {self.quarantine_path}" if self.quarantine_path else reason
+
+
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF = 2.0
+RETRY_MAX_BACKOFF = 120.0
+RETRY_JITTER = 0.5
+RETRY_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+RETRY_EXCEPTIONS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    ConnectionError,
+    TimeoutError,
+    InvalidImageError,
+) + ((httpx.TransportError,) if httpx is not None else ())
+
+
+@dataclass
+class RetryPolicy:
+    """Какие неудачные загрузки повторять и через сколько.
+
+    max_attempts — всего попыток на фото, включая первую (1 — без повторов).
+    Пауза растет как backoff * 2^(n-1) до max_backoff, со случайным разбросом
+    ±jitter, и не меньше Retry-After от сервера.
+    """
+    max_attempts: int = RETRY_ATTEMPTS
+    backoff: float = RETRY_BACKOFF
+    max_backoff: float = RETRY_MAX_BACKOFF
+    jitter: float = RETRY_JITTER
+    statuses: tuple = RETRY_STATUSES
+    exceptions: tuple = RETRY_EXCEPTIONS
+
+    def delay(self, attempt, retry_after=None):
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    def retry_delay(self, task, result, error):
+        """Через сколько секунд повторить задачу, или None, если повторять не нужно."""
+        if task.attempts + 1 >= self.max_attempts:
+            return None
+        if error is not None:
+            if not isinstance(error, self.exceptions) or not getattr(error, "retryable", True):
+                return None
+        elif result.status not in self.statuses:
+            return None
+        return self.delay(task.attempts + 1, result.retry_after if result is not None else None)
+
+
+# --- Планировщик задач по хостам ---
+# Источник задач отдает NOT_READY, когда новых пока нет, но он не закончился
+NOT_READY = object()
+# Как часто проверять такой источник, сек
+SOURCE_POLL = 0.05
+PENDING_LIMIT_FACTOR = 16
+
+
+@dataclass
+class PhotoTask:
+    url: str
+    filename: str
+    host: str
+    row: int = 0
+    col: int = 0
+    etag: str = None
+    last_modified: str = None
+    # другие строки/колонки с той же ссылкой: качаем один раз, раскладываем по всем
+    copies: list = field(default_factory=list)
+    state: str = None
+    # сколько попыток уже закончились ошибкой
+    attempts: int = 0
+    # длительность последней попытки (запрос и тело), сек
+    elapsed: float = None
+    article: str = ""
+    job: object = None
+    # файл этой строки, записанный прошлой загрузкой: только его можно заменить
+    # файлом с другим расширением (остальные могли положить или сконвертировать руками)
+    replaces: str = None
+
+
+@dataclass
+class FetchResult:
+    status: int
+    text: str = ""
+    retry_after: float = None
+    etag: str = None
+    last_modified: str = None
+    length: int = 0
+    sha256: str = None
+    content_type: str = None
+    # ResponseBody, пока файл не записан потоком записи
+    body: object = None
+    # "HTTP/1.1", "HTTP/2" (только asyncio-бэкенд)
+    http_version: str = None
+
+
+class HostScheduler:
+    """Выдает задачи по кругу между хостами, не больше per_host_limit на хост.
+
+    Лимит отдельного хоста можно поменять через set_limit (например, поднять
+    для хоста с HTTP/2). Если задан rate_limiter, хост, которому пока рано слать запрос, пропускается.
+    Задачи можно подавать сразу (add) или лениво из итератора (feed): тогда
+    из него читается ровно столько, чтобы в очереди было не меньше low_water.
+    Если все хосты в очереди заняты или на паузе, читается дальше (до
+    PENDING_LIMIT_FACTOR * low_water), чтобы нашлась работа для других хостов.
+    Отложенные задачи (defer) возвращаются в очередь, только когда остальная
+    работа закончилась и их пауза истекла.
+    """
+
+    def __init__(self, per_host_limit=PER_HOST_LIMIT, rate_limiter=None):
+        self.per_host_limit = max(1, per_host_limit)
+        self.rate_limiter = rate_limiter
+        self._limits = {}
+        self._queues = OrderedDict()
+        self._active = defaultdict(int)
+        self._pending = 0
+        self._source = None
+        self._low_water = 0
+        self._deferred = []
+
+    def __len__(self):
+        return self._pending
+
+    def defer(self, task, delay):
+        self._deferred.append((time.monotonic() + delay, task))
+
+    def _release_deferred(self):
+        if self._source is not None or self._pending or not self._deferred:
+            return
+        now = time.monotonic()
+        waiting = []
+        for ready_at, task in self._deferred:
+            if ready_at <= now:
+                self.add(task)
+            else:
+                waiting.append((ready_at, task))
+        self._deferred = waiting
+
+    def add(self, task):
+        self._queues.setdefault(task.host, deque()).append(task)
+        self._pending += 1
+
+    def limit(self, host):
+        return self._limits.get(host, self.per_host_limit)
+
+    def set_limit(self, host, limit):
+        self._limits[host] = max(1, limit)
+
+    def feed(self, tasks, low_water):
+        self._source = iter(tasks)
+        self._low_water = max(1, low_water)
+
+    def _has_ready_host(self):
+        for host in self._queues:
+            if self._active[host] >= self.limit(host):
+                continue
+            if self.rate_limiter is None or self.rate_limiter.wait_time(host) <= 0:
+                return True
+        return False
+
+    def _refill(self):
+        while self._source is not None and self._pending < self._low_water * PENDING_LIMIT_FACTOR:
+            if self._pending >= self._low_water and self._has_ready_host():
+                break
+            task = next(self._source, None)
+            if task is None:
+                self._source = None
+            elif task is NOT_READY:
+                # источник пока пуст, но еще не закончился
+                break
+            else:
+                self.add(task)
+        self._release_deferred()
+
+    def has_work(self):
+        self._refill()
+        return self._pending > 0 or self._source is not None or bool(self._deferred)
+
+    def next_task(self):
+        self._refill()
+        for host in list(self._queues):
+            if self._active[host] >= self.limit(host):
+                continue
+            if self.rate_limiter is not None:
+                if self.rate_limiter.wait_time(host) > 0:
+                    continue
+                self.rate_limiter.acquire(host)
+            queue = self._queues.pop(host)
+            task = queue.popleft()
+            if queue:
+                # хост уходит в конец очереди — остальные получают свою долю
+                self._queues[host] = queue
+            self._active[host] += 1
+            self._pending -= 1
+            return task
+        return None
+
+    def next_ready_in(self):
+        """Через сколько секунд появится задача, или None, если ждать нужно освобождения слотов."""
+        delays = [
+            self.rate_limiter.wait_time(host) if self.rate_limiter is not None else 0.0
+            for host in self._queues
+            if self._active[host] < self.limit(host)
+        ]
+        if self._source is not None and self._pending < self._low_water:
+            delays.append(SOURCE_POLL)
+        if self._deferred and self._source is None and not self._pending:
+            delays.append(max(0.0, min(ready_at for ready_at, _ in self._deferred) - time.monotonic()))
+        return min(delays) if delays else None
+
+    def release(self, task):
+        self._active[task.host] -= 1
+
+
+class PhotoTooLargeError(Exception):
+    pass
+
+
+@dataclass
+class FetchOptions:
+    referer: str = ""
+    chunk_size: int = CHUNK_SIZE
+    max_bytes: int = MAX_PHOTO_BYTES
+    # Формат PIL ("JPEG", "PNG", "WEBP"), в который перекодировать тело перед записью
+    target_format: str = None
+    metrics: object = None
+    # проверка тела перед записью: None, "magic" или "verify" (см. PAYLOAD_CHECKS)
+    validate: str = "magic"
+
+
+def _request_headers(task, options):
+    headers = {}
+
+    if options.referer.strip():
+        headers["Referer"] = options.referer.strip()
+
+    if task.etag or task.last_modified:
+        if task.etag:
+            headers["If-None-Match"] = task.etag
+        if task.last_modified:
+            headers["If-Modified-Since"] = task.last_modified
+    else:
+        headers.update(NO_CACHE_HEADERS)
+
+    return headers
+
+
+def _ok_result(r, length, digest, body):
+    return FetchResult(r.status_code, etag=r.headers.get("ETag"),
+                       last_modified=r.headers.get("Last-Modified"), length=length,
+                       sha256=digest.hexdigest(), content_type=r.headers.get("Content-Type"), body=body,
+                       http_version=getattr(r, "http_version", None))
+
+
+def _check_size(received, options):
+    if options.max_bytes and received > options.max_bytes:
+        raise PhotoTooLargeError(f"файл больше {round(options.max_bytes / (1024 * 1024), 1):g} МБ")
+
+
+def _error_text(chunk):
+    return chunk[:500].decode("utf-8", errors="replace").replace("\n", " ")
+
+
+def _same_path(path, other):
+    return other is not None and os.path.normcase(os.path.abspath(path)) == os.path.normcase(os.path.abspath(other))
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _temp_path(path, suffix=".part"):
+    """Новый пустой временный файл рядом с path со своим уникальным именем.
+
+    Две задачи с одинаковым именем фото (один артикул в разных строках)
+    пишутся разными потоками — общее "<имя>.part" они затирали бы друг другу.
+    """
+    folder, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix, prefix=name + ".", dir=folder or None)
+    os.close(fd)
+    return tmp_path
+
+
+# --- Конвейер: чтение строк → загрузка → запись на диск → обработка ---
+# Формат PIL → расширение файла
+IMAGE_EXTENSIONS = {
+    "JPEG": ".jpg",
+    "PNG": ".png",
+    "WEBP": ".webp",
+    "GIF": ".gif",
+    "BMP": ".bmp",
+    "TIFF": ".tif",
+    "AVIF": ".avif",
+    "HEIF": ".heic",
+}
+CONTENT_TYPE_FORMATS = {
+    "image/jpeg": "JPEG",
+    "image/jpg": "JPEG",
+    "image/pjpeg": "JPEG",
+    "image/png": "PNG",
+    "image/webp": "WEBP",
+    "image/gif": "GIF",
+    "image/bmp": "BMP",
+    "image/tiff": "TIFF",
+    "image/avif": "AVIF",
+    "image/heic": "HEIF",
+    "image/heif": "HEIF",
+}
+SNIFF_BYTES = 32
+# "magic" — сигнатура и Content-Type, "verify" — вдобавок полное декодирование
+PAYLOAD_CHECKS = ("magic", "verify")
+# Куда откладываются ответы, не прошедшие проверку (рядом с папками артикулов)
+QUARANTINE_FOLDER = "_quarantine"
+
+
+def _sniff_format(head, content_type=None):
+    """Настоящий формат картинки по первым байтам, иначе по Content-Type; None — не распознан."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"avif", b"avis"):
+            return "AVIF"
+        if brand in (b"heic", b"heix", b"mif1", b"msf1"):
+            return "HEIF"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "TIFF"
+    if head[:2] == b"BM":
+        return "BMP"
+    if content_type:
+        return CONTENT_TYPE_FORMATS.get(content_type.split(";")[0].strip().lower())
+    return None
+
+
+def _with_extension(filename, extension):
+    return os.path.splitext(filename)[0] + extension
+
+
+def _identify_payload(body, content_type):
+    """Формат тела, не узнанного по первым байтам (редкий формат), иначе InvalidImageError."""
+    if not body.size:
+        raise InvalidImageError("пустой ответ", retryable=True)
+    mime = (content_type or "").split(";")[0].strip().lower()
+    start = body.head.lstrip(b"\xef\xbb\xbf \t\r\n")[:1]
+    if not mime.startswith("image/") and (start in (b"<", b"{", b"[") or mime.startswith("text/")
+                                          or mime.endswith(("json", "xml", "javascript"))):
+        raise InvalidImageError(f"вместо фото пришла страница ({mime or 'Content-Type не указан'})", markup=True)
+    try:
+        with Image.open(body.source()) as img:
+            return img.format
+    except Exception:
+        raise InvalidImageError(f"не изображение (Content-Type {mime or 'не указан'})") from None
+
+
+def _verify_image(open_source):
+    """Проверка структуры (Image.verify) и декодирование до конца — ловит обрезанные файлы.
+
+    open_source() каждый раз отдает новый путь или файловый объект: после
+    verify() открытое изображение использовать нельзя.
+    """
+    try:
+        with Image.open(open_source()) as img:
+            img.verify()
+        with Image.open(open_source()) as img:
+            # JPEG декодируется в 1/8 размера: данные читаются целиком, а работы в разы меньше
+            img.draft("RGB", (1, 1))
+            img.load()
+    except Exception as e:
+        raise InvalidImageError(f"файл поврежден или обрезан: {e}", retryable=True) from None
+
+
+def _quarantine_path(filename):
+    """<папка Excel>/_quarantine/<имя фото>.bad — вне папок артикулов, конвертор его не увидит."""
+    article_folder, name = os.path.split(filename)
+    return os.path.join(os.path.dirname(article_folder), QUARANTINE_FOLDER, name + ".bad")
+
+
+def _save_image_as(source, filename, target_format, metrics=None):
+    """Декодирует source (путь или файловый объект) и атомарно сохраняет в target_format."""
+    tmp_path = _temp_path(filename, ".tmp")
+    try:
+        started = time.perf_counter()
+        try:
+            with Image.open(source) as img:
+                rgb = img.convert("RGB")
+        except UnidentifiedImageError as e:
+            raise InvalidImageError(f"не декодируется: {e}") from None
+        except Exception as e:
+            # формат узнан, но данные не читаются до конца — скорее всего, обрыв
+            raise InvalidImageError(f"файл поврежден или обрезан: {e}", retryable=True) from None
+        _observe(metrics, "decode", started)
+        started = time.perf_counter()
+        rgb.save(tmp_path, target_format)
+        os.replace(tmp_path, filename)
+        _observe(metrics, "encode", started)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+
+class ResponseBody:
+    """Тело ответа: пока небольшое — в памяти, иначе пишется во временный .part рядом с целью.
+
+    Так загрузчик не ждет диск на обычных фото, а память на поток ограничена
+    SPOOL_BYTES даже для огромных файлов.
+    """
+
+    def __init__(self, filename, spool_bytes=SPOOL_BYTES):
+        self.filename = filename
+        # свой временный файл у каждого тела (_temp_path), создается по надобности
+        self.part_path = None
+        self.spool_bytes = spool_bytes
+        # первые байты — чтобы узнать настоящий формат
+        self.head = b""
+        self.size = 0
+        self._buffer = bytearray()
+        self._file = None
+
+    @property
+    def on_disk(self):
+        return self._file is not None
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if len(self.head) < SNIFF_BYTES:
+            self.head += bytes(chunk[:SNIFF_BYTES - len(self.head)])
+        if self._file is None and len(self._buffer) + len(chunk) > self.spool_bytes:
+            self.part_path = _temp_path(self.filename)
+            self._file = open(self.part_path, "wb")
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._buffer += chunk
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def source(self):
+        """Путь к .part или файловый объект с телом — для PIL."""
+        return self.part_path if self._file is not None else io.BytesIO(self._buffer)
+
+    def finalize(self, target_format=None, metrics=None):
+        """Кладет файл под окончательное имя (вызывается в потоке записи).
+
+        С target_format тело декодируется прямо из памяти (или из .part) и на
+        диск попадает только файл в этом формате.
+        """
+        if target_format is not None:
+            self.close()
+            _save_image_as(self.source(), self.filename, target_format, metrics)
+            self._buffer = bytearray()
+            self._remove_part()
+            return
+        if self._file is None:
+            self.part_path = _temp_path(self.filename)
+            try:
+                with open(self.part_path, "wb") as f:
+                    f.write(self._buffer)
+            except BaseException:
+                self._remove_part()
+                raise
+            self._buffer = bytearray()
+        os.replace(self.part_path, self.filename)
+        self.part_path = None
+
+    def quarantine(self, path):
+        """Откладывает тело в path вместо окончательного имени."""
+        self.close()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self._file is not None:
+            os.replace(self.part_path, path)
+            self.part_path = None
+        else:
+            with open(path, "wb") as f:
+                f.write(self._buffer)
+        self._buffer = bytearray()
+
+    def discard(self):
+        self.close()
+        self._buffer = bytearray()
+        self._remove_part()
+
+    def _remove_part(self):
+        if self.part_path is not None:
+            _remove_quietly(self.part_path)
+            self.part_path = None
+
+
+class WritePipeline:
+    """Потоки записи и необязательной постобработки скачанных файлов.
+
+    submit() блокируется, когда очередь записи полна, — так медленный диск
+    притормаживает загрузку, а не раздувает память. Готовые задачи отдаются
+    в deliver(task, result, error). Формат тела определяется по первым
+    байтам: без target_format файл получает правильное расширение, с ним —
+    перекодируется, только если формат отличается (тогда потоков записи
+    столько же, сколько ядер). validate ("magic", "verify") отсеивает тела,
+    которые не являются фото: они уходят в QUARANTINE_FOLDER, а задача
+    возвращается с InvalidImageError (и повторяется по RetryPolicy).
+    """
+
+    def __init__(self, deliver, post_process=None, writers=WRITER_THREADS,
+                 post_workers=POST_WORKERS, queue_size=WRITE_QUEUE_SIZE, target_format=None, metrics=None,
+                 validate=None):
+        self.deliver = deliver
+        self.post_process = post_process
+        self.target_format = target_format
+        self.metrics = metrics
+        self.validate = validate
+        if target_format is not None or validate == "verify":
+            writers = max(writers, POST_WORKERS)
+        self.write_queue = queue.Queue(queue_size)
+        self.post_queue = queue.Queue(queue_size) if post_process is not None else None
+        self._writers = [threading.Thread(target=self._write_loop, daemon=True) for _ in range(writers)]
+        self._post = []
+        if post_process is not None:
+            self._post = [threading.Thread(target=self._post_loop, daemon=True) for _ in range(post_workers)]
+        for thread in self._writers + self._post:
+            thread.start()
+
+    def submit(self, task, result):
+        self.write_queue.put((task, result))
+
+    def depths(self):
+        return {
+            "запись": self.write_queue.qsize(),
+            "обработка": self.post_queue.qsize() if self.post_queue is not None else 0
+        }
+
+    def _inspect(self, body, content_type):
+        """Настоящий формат тела; InvalidImageError, если проверка validate не пройдена."""
+        source_format = _sniff_format(body.head)
+        if self.validate is None:
+            return source_format or _sniff_format(b"", content_type)
+        if source_format is None:
+            source_format = _identify_payload(body, content_type)
+        # при перекодировании тело и так декодируется целиком
+        if self.validate == "verify" and source_format == (self.target_format or source_format):
+            started = time.perf_counter()
+            _verify_image(body.source)
+            _observe(self.metrics, "decode", started)
+        return source_format
+
+    def _reject(self, task, body, error):
+        try:
+            path = _quarantine_path(task.filename)
+            body.quarantine(path)
+            error.quarantine_path = path
+        except OSError:
+            body.discard()
+        self.deliver(task, None, error)
+
+    def _write_loop(self):
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                return
+            task, result = item
+            body = result.body
+            try:
+                source_format = self._inspect(body, result.content_type)
+            except InvalidImageError as e:
+                self._reject(task, body, e)
+                continue
+            transcode = self.target_format if source_format != self.target_format else None
+            if self.target_format is None and source_format in IMAGE_EXTENSIONS:
+                body.filename = _with_extension(task.filename, IMAGE_EXTENSIONS[source_format])
+            started = time.perf_counter()
+            try:
+                body.finalize(transcode, self.metrics)
+            except InvalidImageError as e:
+                self._reject(task, body, e)
+                continue
+            except Exception as e:
+                body.discard()
+                self.deliver(task, None, e)
+                continue
+            result.body = None
+            if transcode is None:
+                _observe(self.metrics, "write", started)
+            if body.filename != task.filename:
+                if _same_path(task.filename, task.replaces):
+                    # прежняя версия этого фото с другим расширением больше не нужна
+                    _remove_quietly(task.filename)
+                task.filename = body.filename
+            if transcode is not None:
+                # размер на диске — для проверок 304 и дедупликации в следующих запусках
+                result.length = _file_size(task.filename)
+            if self.post_queue is not None:
+                self.post_queue.put((task, result))
+            else:
+                self.deliver(task, result, None)
+
+    def _post_loop(self):
+        while True:
+            item = self.post_queue.get()
+            if item is None:
+                return
+            task, result = item
+            started = time.perf_counter()
+            try:
+                self.post_process(task, result)
+            except Exception as e:
+                self.deliver(task, None, e)
+                continue
+            _observe(self.metrics, "post", started)
+            self.deliver(task, result, None)
+
+    def close(self):
+        for _ in self._writers:
+            self.write_queue.put(None)
+        for thread in self._writers:
+            thread.join()
+        for _ in self._post:
+            self.post_queue.put(None)
+        for thread in self._post:
+            thread.join()
+
+
+class RowReader(threading.Thread):
+    """Читает строки Excel в отдельном потоке в ограниченную очередь."""
+
+    def __init__(self, rows, maxsize=READ_QUEUE_SIZE):
+        super().__init__(daemon=True)
+        self.rows = rows
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self._finished = False
+
+    def run(self):
+        try:
+            for item in self.rows:
+                self.queue.put(item)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.queue.put(None)
+
+    def __iter__(self):
+        """Строки по мере готовности; NOT_READY, если читатель отстает."""
+        while not self._finished:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                yield NOT_READY
+                continue
+            if item is None:
+                self._finished = True
+                return
+            yield item
+
+
+def _fetch_photo(task, options):
+    started = time.perf_counter()
+    with session.get(
+        task.url,
+        headers=_request_headers(task, options),
+        timeout=(10, 30),
+        allow_redirects=True,
+        stream=True
+    ) as r:
+        # requests не показывает DNS/соединение/TLS отдельно — они входят в "ответ"
+        _observe(options.metrics, "ttfb", started, task.host)
+        if r.status_code == 304:
+            return FetchResult(r.status_code)
+
+        if r.status_code != 200:
+            try:
+                txt = _error_text(next(r.iter_content(2048), b""))
+            except Exception:
+                txt = ""
+            return FetchResult(r.status_code, txt, _parse_retry_after(r.headers.get("Retry-After")))
+
+        _check_size(int(r.headers.get("Content-Length") or 0), options)
+
+        body = ResponseBody(task.filename)
+        received = 0
+        digest = hashlib.sha256()
+        body_started = time.perf_counter()
+        try:
+            for chunk in r.iter_content(options.chunk_size):
+                received += len(chunk)
+                _check_size(received, options)
+                digest.update(chunk)
+                body.write(chunk)
+            body.close()
+        except BaseException:
+            body.discard()
+            raise
+        _observe(options.metrics, "body", body_started, task.host)
+
+        return _ok_result(r, received, digest, body)
+
+
+def _dispatch(scheduler, max_in_flight, start, events, pipeline, on_result, pipeline_stats, on_release=None):
+    """Выдает задачи и обрабатывает результаты в вызывающем потоке.
+
+    start(task) запускает загрузку в фоне; о ходе она сообщает через очередь
+    events: (False, task, result, None) — место загрузки освободилось (файл мог
+    еще не записаться), (True, task, result, error) — задача завершена.
+    Планировщик, on_result и on_release вызываются только из этого потока.
+    """
+    in_flight = 0
+    unfinished = 0
+    while scheduler.has_work() or unfinished:
+        while in_flight < max_in_flight:
+            task = scheduler.next_task()
+            if task is None:
+                break
+            start(task)
+            in_flight += 1
+            unfinished += 1
+
+        pipeline_stats(in_flight, pipeline.depths())
+        ready_in = None
+        if in_flight < max_in_flight and scheduler.has_work():
+            ready_in = scheduler.next_ready_in()
+        elif not unfinished:
+            # источник закончился, не дав задач (например, после NOT_READY): ждать нечего
+            continue
+        try:
+            finished, task, result, error = events.get(timeout=ready_in)
+        except queue.Empty:
+            continue
+
+        if finished:
+            unfinished -= 1
+            on_result(task, result, error)
+        else:
+            in_flight -= 1
+            scheduler.release(task)
+            if on_release is not None:
+                on_release(task, result)
+
+
+def _download_threaded(scheduler, max_workers, options, on_result, pipeline_stats, post_process=None):
+    # Колбэки вызываются только из этого потока; загрузка, запись и обработка
+    # идут в своих пулах и сообщают о себе через очередь events
+    events = queue.Queue()
+    pipeline = WritePipeline(lambda task, result, error: events.put((True, task, result, error)),
+                             post_process, target_format=options.target_format, metrics=options.metrics,
+                             validate=options.validate)
+
+    def fetch(task):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = _fetch_photo(task, options)
+        except Exception as e:
+            task.elapsed = time.perf_counter() - started
+            events.put((True, task, None, e))
+        else:
+            task.elapsed = time.perf_counter() - started
+            if result.body is not None:
+                pipeline.submit(task, result)
+            else:
+                events.put((True, task, result, None))
+        events.put((False, task, result, None))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            _dispatch(scheduler, max_workers, lambda task: executor.submit(fetch, task), events, pipeline,
+                      on_result, pipeline_stats)
+    finally:
+        pipeline.close()
+
+
+# --- Асинхронный бэкенд (httpx, HTTP/2) ---
+def _trace_connection(metrics, host):
+    """Колбэк трассировки httpx: время установки TCP-соединения и TLS."""
+    started = {}
+
+    async def trace(event, info):
+        stage = {"connection.connect_tcp": "connect", "connection.start_tls": "tls"}.get(event.rsplit(".", 1)[0])
+        if stage is None:
+            return
+        if event.endswith(".started"):
+            started[stage] = time.perf_counter()
+        elif event.endswith(".complete") and stage in started:
+            _observe(metrics, stage, started.pop(stage), host)
+
+    return trace
+
+
+async def _fetch_photo_async(client, task, options):
+    started = time.perf_counter()
+    extensions = {"trace": _trace_connection(options.metrics, task.host)} if options.metrics is not None else None
+    async with client.stream("GET", task.url, headers=_request_headers(task, options), extensions=extensions) as r:
+        _observe(options.metrics, "ttfb", started, task.host)
+        if r.status_code == 304:
+            return FetchResult(r.status_code, http_version=r.http_version)
+
+        if r.status_code != 200:
+            txt = ""
+            try:
+                async for chunk in r.aiter_bytes(2048):
+                    txt = _error_text(chunk)
+                    break
+            except Exception:
+                pass
+            return FetchResult(r.status_code, txt, _parse_retry_after(r.headers.get("Retry-After")),
+                               http_version=r.http_version)
+
+        _check_size(int(r.headers.get("Content-Length") or 0), options)
+
+        body = ResponseBody(task.filename)
+        received = 0
+        digest = hashlib.sha256()
+        body_started = time.perf_counter()
+        try:
+            async for chunk in r.aiter_bytes(options.chunk_size):
+                received += len(chunk)
+                _check_size(received, options)
+                digest.update(chunk)
+                if body.on_disk:
+                    # большой файл уже пишется на диск — не останавливаем цикл событий
+                    await asyncio.to_thread(body.write, chunk)
+                else:
+                    body.write(chunk)
+            await asyncio.to_thread(body.close)
+        except BaseException:
+            body.discard()
+            raise
+        _observe(options.metrics, "body", body_started, task.host)
+
+        return _ok_result(r, received, digest, body)
+
+
+def _download_async(scheduler, max_in_flight, per_host_limit, per_host_streams, options, on_result,
+                    pipeline_stats, post_process=None):
+    # Цикл событий в своем потоке только качает. Планирование, манифест и
+    # результаты (папки, SQLite, копии, журнал) остаются в вызывающем потоке,
+    # как у потокового бэкенда, и не останавливают загрузки
+    client_headers = {k: v for k, v in session.headers.items() if k != "Connection"}
+    # Отдельный маленький пул на каждый хост: с HTTP/2 все запросы к хосту идут
+    # потоками его соединений, а общий пул httpx плохо масштабируется.
+    # per_host_limit ограничивает соединения, per_host_streams — запросы к хосту
+    # с HTTP/2 (пока хост не ответил по HTTP/2, запросов не больше, чем соединений)
+    clients = {}
+    events = queue.Queue()
+    pipeline = WritePipeline(lambda task, result, error: events.put((True, task, result, error)),
+                             post_process, target_format=options.target_format, metrics=options.metrics,
+                             validate=options.validate)
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, name="download-async", daemon=True)
+    loop_thread.start()
+    running = []
+
+    def client_for(host):
+        client = clients.get(host)
+        if client is None:
+            client = httpx.AsyncClient(
+                http2=h2 is not None,
+                headers=client_headers,
+                timeout=httpx.Timeout(30, connect=10),
+                limits=httpx.Limits(max_connections=per_host_limit,
+                                    max_keepalive_connections=per_host_limit),
+                follow_redirects=True
+            )
+            clients[host] = client
+        return client
+
+    async def fetch(task):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await _fetch_photo_async(client_for(task.host), task, options)
+        except Exception as e:
+            task.elapsed = time.perf_counter() - started
+            events.put((True, task, None, e))
+        else:
+            task.elapsed = time.perf_counter() - started
+            if result.body is not None:
+                # очередь записи полна — ждем в отдельном потоке, не блокируя цикл
+                await asyncio.to_thread(pipeline.submit, task, result)
+            else:
+                events.put((True, task, result, None))
+        events.put((False, task, result, None))
+
+    def start(task):
+        running[:] = [future for future in running if not future.done()]
+        running.append(asyncio.run_coroutine_threadsafe(fetch(task), loop))
+
+    def on_release(task, result):
+        if result is not None and result.http_version == "HTTP/2":
+            scheduler.set_limit(task.host, per_host_streams)
+
+    async def close_clients():
+        for client in clients.values():
+            await client.aclose()
+
+    try:
+        _dispatch(scheduler, max_in_flight, start, events, pipeline, on_result, pipeline_stats, on_release)
+    finally:
+        wait(running)
+        pipeline.close()
+        asyncio.run_coroutine_threadsafe(close_clients(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        loop_thread.join()
+        loop.close()
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+# --- Манифест загрузки (для продолжения прерванных запусков) ---
+# "done" — файл записан загрузкой, "present" — уже лежал на диске и принят как есть
+RESUMABLE_STATES = ("done", "present")
+
+
+def _connect_read_only(path):
+    """Соединение с SQLite-файлом только для чтения, не создающее -wal/-shm рядом.
+
+    Пока файл не открыт другим запуском (-wal нет), он читается как неизменяемый:
+    SQLite не берет блокировок и не создает служебных файлов.
+    """
+    flags = "mode=ro" if os.path.exists(path + "-wal") else "mode=ro&immutable=1"
+    return sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?{flags}", uri=True)
+
+
+def _written_files(previous):
+    """{(row, col): filename} файлов, которые записали прошлые загрузки."""
+    return {key: filename for key, (_, state, filename) in previous.items() if state == "done" and filename}
+
+
+def _resumed(previous_url, previous_state, url, validators):
+    """Пропустить ли без запроса строку, готовую после прошлого запуска.
+
+    Если для ссылки сохранены ETag/Last-Modified (validators, revalidate), строка
+    спрашивается условным запросом: 304 обходится дешево, а фото, замененное на
+    сервере, иначе не обновилось бы никогда.
+    """
+    return previous_url == url and previous_state in RESUMABLE_STATES and url not in validators
+
+
+class DownloadManifest:
+    """SQLite-файл рядом с Excel: состояние каждой ссылки (file, row, col, url).
+
+    Используется только из потока, который вызывает колбэки download_photos.
+    read_only — только чтение существующего файла (для плана): ничего не
+    создается и не записывается.
+    """
+
+    COMMIT_EVERY = 200
+
+    def __init__(self, excel_path, read_only=False):
+        self.file = os.path.basename(excel_path)
+        self.path = self.path_for(excel_path)
+        self._uncommitted = 0
+        if read_only:
+            self._conn = _connect_read_only(self.path)
+            return
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " file TEXT, row INTEGER, col INTEGER, url TEXT, filename TEXT,"
+            " state TEXT, attempts INTEGER DEFAULT 0, error TEXT, updated REAL,"
+            " PRIMARY KEY (file, row, col))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS http_cache ("
+            " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, length INTEGER, updated REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS content ("
+            " url TEXT PRIMARY KEY, sha256 TEXT, filename TEXT, length INTEGER)"
+        )
+
+    @staticmethod
+    def path_for(excel_path):
+        return os.path.splitext(excel_path)[0] + ".manifest.sqlite"
+
+    def load(self):
+        """{(row, col): (url, state, filename)} для всех задач этого Excel-файла."""
+        cur = self._conn.execute("SELECT row, col, url, state, filename FROM tasks WHERE file = ?", (self.file,))
+        return {(row, col): (url, state, filename) for row, col, url, state, filename in cur}
+
+    def add_pending(self, task, state="pending"):
+        self._conn.execute(
+            "INSERT INTO tasks (file, row, col, url, filename, state, updated) VALUES (?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (file, row, col) DO UPDATE SET url = excluded.url, filename = excluded.filename,"
+            " state = excluded.state, updated = excluded.updated",
+            (self.file, task.row, task.col, task.url, task.filename, state, time.time())
+        )
+        self._changed()
+
+    def load_validators(self):
+        """{url: (etag, last_modified, length)} из прошлых запусков."""
+        cur = self._conn.execute("SELECT url, etag, last_modified, length FROM http_cache")
+        return {url: (etag, last_modified, length) for url, etag, last_modified, length in cur}
+
+    def store_validators(self, url, etag, last_modified, length):
+        if not etag and not last_modified:
+            self._conn.execute("DELETE FROM http_cache WHERE url = ?", (url,))
+        else:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO http_cache (url, etag, last_modified, length, updated)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, length, time.time())
+            )
+        self._changed()
+
+    def load_content(self):
+        return self._conn.execute("SELECT url, sha256, filename, length FROM content").fetchall()
+
+    def store_content(self, url, sha256, filename, length):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO content (url, sha256, filename, length) VALUES (?, ?, ?, ?)",
+            (url, sha256, filename, length)
+        )
+        self._changed()
+
+    def mark(self, task, state, error=None):
+        self._conn.execute(
+            "UPDATE tasks SET state = ?, filename = ?, attempts = attempts + 1, error = ?, updated = ?"
+            " WHERE file = ? AND row = ? AND col = ?",
+            (state, task.filename, error, time.time(), self.file, task.row, task.col)
+        )
+        self._changed()
+
+    def _changed(self):
+        self._uncommitted += 1
+        if self._uncommitted >= self.COMMIT_EVERY:
+            self.flush()
+
+    def flush(self):
+        self._conn.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+# --- Дедупликация одинаковых фото ---
+def _link_or_copy(src, dst):
+    """Жесткая ссылка на src (или копия, если ФС не умеет ссылки) на месте dst."""
+    if os.path.normcase(os.path.abspath(src)) == os.path.normcase(os.path.abspath(dst)):
+        return
+    tmp_path = _temp_path(dst)
+    try:
+        # ссылка создается только на свободное имя
+        os.remove(tmp_path)
+        try:
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+
+class ContentStore:
+    """Какие байты (sha256) отдавал URL и где на диске они уже лежат."""
+
+    def __init__(self, manifest=None):
+        self.manifest = manifest
+        self._url_hash = {}
+        self._paths = {}
+        self.requests_saved = 0
+        self.bytes_saved = 0
+        if manifest is not None:
+            for url, sha256, filename, length in manifest.load_content():
+                self._url_hash[url] = sha256
+                self._paths[sha256] = (filename, length)
+
+    def _existing(self, sha256):
+        filename, length = self._paths.get(sha256, (None, None))
+        if filename is not None and _file_size(filename) == length:
+            return filename
+        return None
+
+    def local_copy(self, url):
+        """Файл с содержимым этого URL из прошлых запусков, если он еще на диске."""
+        sha256 = self._url_hash.get(url)
+        return self._existing(sha256) if sha256 else None
+
+    def add(self, url, sha256, filename, length):
+        """Запоминает скачанный файл; если такие же байты уже есть, заменяет его ссылкой."""
+        existing = self._existing(sha256)
+        if existing is not None and existing != filename:
+            try:
+                _link_or_copy(existing, filename)
+                self.bytes_saved += length
+            except OSError:
+                pass
+        else:
+            self._paths[sha256] = (filename, length)
+        self._url_hash[url] = sha256
+        if self.manifest is not None:
+            self.manifest.store_content(url, sha256, filename, length)
+
+
+# --- Чтение Excel ---
+def iter_excel_rows(excel_path):
+    """Строки первого листа по одной: (номер строки с 0, кортеж значений).
+
+    .xlsx читается потоково (openpyxl read_only), поэтому память не растет
+    с размером файла. Старый .xls целиком читается через pandas.
+    """
+    if os.path.splitext(excel_path)[1].lower() in (".xlsx", ".xlsm"):
+        wb = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
+        return _iter_workbook_rows(wb)
+
+    df = pd.read_excel(excel_path, header=None)
+    return enumerate(df.itertuples(index=False, name=None))
+
+
+def _iter_workbook_rows(wb):
+    try:
+        sheet = wb.worksheets[0]
+        # read_only верит размеру листа из файла, а многие выгрузки пишут туда
+        # устаревший "A1" — тогда читалась бы одна ячейка. Строки бывают разной длины
+        sheet.reset_dimensions()
+        for idx, values in enumerate(sheet.iter_rows(min_row=1, values_only=True)):
+            yield idx, values
+    finally:
+        wb.close()
+
+
+def _cell_text(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    return str(value).strip() or None
+
+
+# --- Журнал запуска ---
+RUN_LOG_FOLDER = "import_logs"
+RUN_LOG_FIELDS = ("time", "outcome", "excel", "article", "url", "host", "path",
+                  "status", "bytes", "latency_ms", "retries", "error")
+# Как часто сбрасывать журнал на диск, сек
+RUN_LOG_FLUSH_EVERY = 2.0
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+class RunLog:
+    """Исход каждой ссылки в run-<время>.jsonl и .csv плюс итог запуска в .summary.json.
+
+    Записи идут из потока диспетчера в буферизованные файлы и сбрасываются
+    на диск раз в RUN_LOG_FLUSH_EVERY секунд, поэтому загрузку не тормозят.
+    Исходы: done, unchanged, linked, skipped, retry, failed.
+    """
+
+    def __init__(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, time.strftime("run-%Y%m%d-%H%M%S"))
+        suffix = 1
+        while os.path.exists(self.path + ".jsonl"):
+            suffix += 1
+            self.path = os.path.join(folder, time.strftime("run-%Y%m%d-%H%M%S") + f"-{suffix}")
+        self._jsonl = open(self.path + ".jsonl", "w", encoding="utf-8")
+        # utf-8-sig — чтобы Excel открыл CSV с кириллицей
+        self._csv_file = open(self.path + ".csv", "w", encoding="utf-8-sig", newline="")
+        self._csv = csv.DictWriter(self._csv_file, RUN_LOG_FIELDS)
+        self._csv.writeheader()
+        self.started = time.time()
+        self._last_flush = time.monotonic()
+        self.counts = defaultdict(int)
+        self.bytes = 0
+        self._latency = defaultdict(list)
+        self._failed = defaultdict(int)
+
+    def record(self, outcome, excel, article, url, path, status=None, length=0, latency=None,
+               retries=0, error=None):
+        host = urlparse(url).netloc.lower()
+        row = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "outcome": outcome,
+            "excel": excel,
+            "article": article,
+            "url": url,
+            "host": host,
+            "path": path,
+            "status": status,
+            "bytes": length,
+            "latency_ms": round(latency * 1000, 1) if latency is not None else None,
+            "retries": retries,
+            "error": error,
+        }
+        self._jsonl.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._csv.writerow(row)
+
+        self.counts[outcome] += 1
+        if outcome == "done":
+            self.bytes += length or 0
+        if latency is not None:
+            self._latency[host].append(latency * 1000)
+        if outcome in ("failed", "retry") and latency is not None:
+            self._failed[host] += 1
+
+        now = time.monotonic()
+        if now - self._last_flush >= RUN_LOG_FLUSH_EVERY:
+            self._last_flush = now
+            self._jsonl.flush()
+            self._csv_file.flush()
+
+    def summary(self):
+        elapsed = max(time.time() - self.started, 1e-6)
+        hosts = {}
+        for host in sorted(set(self._latency) | set(self._failed)):
+            latencies = self._latency[host]
+            p50, p95 = _percentile(latencies, 0.5), _percentile(latencies, 0.95)
+            hosts[host] = {
+                "requests": len(latencies),
+                "failed": self._failed[host],
+                "p50_ms": round(p50, 1) if p50 is not None else None,
+                "p95_ms": round(p95, 1) if p95 is not None else None,
+            }
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "elapsed_sec": round(elapsed, 2),
+            "counts": dict(self.counts),
+            "bytes": self.bytes,
+            "photos_per_sec": round(self.counts["done"] / elapsed, 2),
+            "mb_per_sec": round(self.bytes / (1024 * 1024) / elapsed, 2),
+            "hosts": hosts,
+        }
+
+    def close(self, log_callback, metrics=None):
+        """Закрывает файлы, пишет .summary.json (и .metrics.json) и краткий итог в лог."""
+        summary = self.summary()
+        self._jsonl.close()
+        self._csv_file.close()
+        with open(self.path + ".summary.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        if metrics is not None:
+            metrics.export(self.path + ".metrics.json")
+
+        counts = summary["counts"]
+        log_callback(
+            f"📈 Итог запуска: скачано {counts.get('done', 0)}, не изменилось {counts.get('unchanged', 0)}, "
+            f"копий {counts.get('linked', 0)}, пропущено {counts.get('skipped', 0)}, "
+            f"ошибок {counts.get('failed', 0)} за {summary['elapsed_sec']:.0f} сек "
+            f"({summary['photos_per_sec']} фото/сек, {summary['mb_per_sec']} МБ/сек)"
+        )
+        busiest = sorted(summary["hosts"].items(), key=lambda item: -item[1]["requests"])[:10]
+        for host, stats in busiest:
+            if stats["requests"]:
+                log_callback(
+                    f"🌐 {host}: запросов {stats['requests']}, ошибок {stats['failed']}, "
+                    f"p50 {stats['p50_ms']:.0f} мс, p95 {stats['p95_ms']:.0f} мс"
+                )
+        log_callback(f"📝 Журнал: {self.path}.jsonl, .csv, .summary.json"
+                     + (", .metrics.json" if metrics is not None else ""))
+
+
 # --- Логика скачивания ---
-def download_photos(
-        excel_path,
+@dataclass
+class DownloadSettings:
+    """Настройки, общие для всех Excel-файлов одного запуска."""
+    article_col: int
+    photo_cols: list
+    article_suffix: str = ""
+    start_index: int = 1
+    static_before: str = ""
+    static_after: str = ""
+    resume: bool = True
+    revalidate: bool = True
+    dedupe: bool = True
+    # расширение по умолчанию; с detect_format его заменит настоящее
+    extension: str = ".jpg"
+    detect_format: bool = True
+    # не запрашивать фото, файл которого уже лежит в папке артикула
+    skip_existing: bool = False
+    # проверка найденного файла: None, "size" или "decode"
+    verify_existing: str = None
+
+
+EXISTING_CHECKS = ("size", "decode")
+# Проверка "decode" идет в пуле потоков, а не в потоке диспетчера: файл
+# читается с диска, поэтому потоков не меньше, чем потоков записи. Если
+# проверки ждут столько фото, чтение строк приостанавливается
+DECODE_CHECK_WORKERS = max(WRITER_THREADS, POST_WORKERS)
+DECODE_CHECK_BACKLOG = DECODE_CHECK_WORKERS * 4
+
+
+def _download_settings(article_col, photo_cols, article_suffix="", start_index=1, static_before="",
+                       static_after="", resume=True, revalidate=True, dedupe=True, convert_to=None,
+                       skip_existing=False, verify_existing=None, **_):
+    """DownloadSettings из параметров download_photos_batch (лишние параметры пропускаются)."""
+    settings = DownloadSettings(article_col, photo_cols, article_suffix, start_index,
+                                static_before, static_after, resume, revalidate, dedupe,
+                                skip_existing=skip_existing, verify_existing=verify_existing)
+    if convert_to:
+        settings.extension = _target_extensions(convert_to)[0]
+        settings.detect_format = False
+    return settings
+
+
+def _row_article(row, settings):
+    article = _cell_text(row[settings.article_col] if settings.article_col < len(row) else None)
+    return article.replace(".0", "") if article else None
+
+
+def _photo_filename(folder, article, j, settings):
+    s = settings
+    return os.path.join(folder, f"{article}{s.article_suffix}{s.static_before}_{s.static_after}{j}{s.extension}")
+
+
+class PresenceIndex:
+    """Какие файлы уже лежат в папках артикулов.
+
+    Каждая папка читается одним os.scandir при первом обращении, дальше
+    наличие файла проверяется по словарю, а не отдельным stat на каждый путь.
+    Размер берется у DirEntry только когда нужен.
+    """
+
+    def __init__(self):
+        self._folders = {}
+
+    def _entries(self, folder):
+        entries = self._folders.get(folder)
+        if entries is None:
+            entries = {}
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        entries[os.path.normcase(entry.name)] = entry
+            except OSError:
+                # папки еще нет — и файлов в ней тоже
+                pass
+            self._folders[folder] = entries
+        return entries
+
+    def size(self, path):
+        """Размер файла или None, если его нет."""
+        folder, name = os.path.split(path)
+        entry = self._entries(folder).get(os.path.normcase(name))
+        try:
+            return entry.stat().st_size if entry is not None and entry.is_file() else None
+        except OSError:
+            return None
+
+    def find(self, filename, detect_format, recorded=None):
+        """Файл этого фото, оставшийся от прошлых запусков (с любым расширением, если формат определяется).
+
+        recorded — имя из манифеста: оно проверяется первым, чтобы рядом лежащая
+        копия в формате по умолчанию (например, сконвертированная) не подменила его.
+        """
+        folder, name = os.path.split(filename)
+        entries = self._entries(folder)
+        candidates = [filename]
+        if detect_format:
+            candidates += [_with_extension(filename, extension) for extension in IMAGE_EXTENSIONS.values()]
+        if recorded is not None and any(_same_path(recorded, candidate) for candidate in candidates):
+            candidates.insert(0, recorded)
+        for candidate in candidates:
+            if os.path.normcase(os.path.basename(candidate)) in entries and self.size(candidate) is not None:
+                return candidate
+        return None
+
+
+def _existing_valid(path, check, size, length=None):
+    """Годится ли найденный файл: check "size" — не пустой и совпадает с length
+    из прошлой загрузки (если известна), "decode" — вдобавок декодируется до конца."""
+    if check is None:
+        return True
+    if not size or (length is not None and size != length):
+        return False
+    if check == "decode":
+        try:
+            _verify_image(lambda: path)
+        except InvalidImageError:
+            return False
+    return True
+
+
+def _checked_in_order(photos, verify_existing):
+    """Пары (photo, годится ли найденный файл) в порядке photos.
+
+    photos отдает пары (photo, аргументы _existing_valid или None, если файла
+    нет). С verify_existing="decode" файлы декодируются в пуле потоков, как в
+    ExcelJob.plan, и вперед проверяется не больше DECODE_CHECK_BACKLOG фото.
+    """
+    if verify_existing != "decode":
+        for photo, args in photos:
+            yield photo, args is None or _existing_valid(*args)
+        return
+    pool = ThreadPoolExecutor(max_workers=DECODE_CHECK_WORKERS)
+    checks = deque()
+    try:
+        for photo, args in photos:
+            checks.append((photo, pool.submit(_existing_valid, *args) if args is not None else None))
+            while checks and (len(checks) >= DECODE_CHECK_BACKLOG or checks[0][1] is None or checks[0][1].done()):
+                photo, future = checks.popleft()
+                yield photo, future is None or future.result()
+        for photo, future in checks:
+            yield photo, future is None or future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ExcelJob:
+    """Загрузка одного Excel-файла внутри общего запуска.
+
+    Все методы вызываются из потока, который вызывает колбэки (диспетчера).
+    """
+
+    def __init__(self, excel_path, settings, log_callback, run_log=None):
+        self.excel_path = excel_path
+        self.settings = settings
+        self.log_callback = log_callback
+        self.run_log = run_log
+        self.base_folder = os.path.dirname(excel_path)
+        self.reader = None
+        self.manifest = None
+        self.content = None
+        self.previous = {}
+        self.written = {}
+        self.validators = {}
+        self.by_url = {}
+        self.presence = PresenceIndex()
+        self.total = 0
+        self.done = 0
+        self.skipped = 0
+        self.present = 0
+        self.damaged = 0
+        self.unchanged = 0
+        self.retries = 0
+        self.healed = 0
+        # пути в _quarantine: повторы одного фото перезаписывают тот же файл
+        self.quarantined = set()
+        self.outstanding = 0
+        self.planned = False
+        self.closed = False
+
+    def open(self):
+        try:
+            self.reader = RowReader(iter_excel_rows(self.excel_path))
+        except Exception as e:
+            self.log_callback(f"❌ Ошибка при чтении {self.excel_path}: {e}")
+            return False
+        self.reader.start()
+
+        try:
+            self.manifest = DownloadManifest(self.excel_path)
+            previous = self.manifest.load()
+            self.written = _written_files(previous)
+            if self.settings.resume:
+                self.previous = previous
+            if self.settings.revalidate:
+                self.validators = self.manifest.load_validators()
+        except sqlite3.Error as e:
+            self.log_callback(f"⚠️ Манифест недоступен, продолжение прерванной загрузки отключено: {e}")
+            self.manifest = None
+        if self.settings.dedupe:
+            self.content = ContentStore(self.manifest)
+        return True
+
+    def _record(self, outcome, task, result=None, reason=None):
+        if self.run_log is None:
+            return
+        self.run_log.record(
+            outcome, os.path.basename(self.excel_path), task.article, task.url, task.filename,
+            status=result.status if result is not None else None,
+            length=result.length if result is not None else 0,
+            latency=task.elapsed,
+            retries=task.attempts,
+            error=reason
+        )
+
+    def _existing_args(self, existing, url):
+        """Аргументы _existing_valid для найденного файла (размер берется здесь, в потоке диспетчера)."""
+        length = self.validators[url][2] if url in self.validators else None
+        return existing, self.settings.verify_existing, self.presence.size(existing), length
+
+    def _link_local(self, source, task):
+        """Кладет уже имеющийся на диске файл под имя задачи вместо загрузки."""
+        previous = task.filename
+        if self.settings.detect_format:
+            task.filename = _with_extension(task.filename, os.path.splitext(source)[1])
+        try:
+            _link_or_copy(source, task.filename)
+            if previous != task.filename and _same_path(previous, task.replaces):
+                _remove_quietly(previous)
+            self.log_callback(f"🔗 {task.filename}")
+            self.content.requests_saved += 1
+            self.content.bytes_saved += _file_size(task.filename) or 0
+            task.state, reason = "done", None
+        except OSError as e:
+            self.log_callback(f"❌ Не удалось скопировать {source} → {task.filename}: {e}")
+            task.state, reason = "failed", str(e)
+        if self.manifest is not None:
+            self.manifest.mark(task, task.state, reason)
+        self._record("linked" if task.state == "done" else "failed", task, reason=reason)
+
+    def plan(self):
+        """Читает строки Excel по мере надобности и отдает задачи для загрузки.
+
+        С verify_existing="decode" найденные файлы проверяются в пуле потоков:
+        фото ждет результата в очереди checks, а пока проверять нечего другого,
+        диспетчер получает NOT_READY и качает уже выданное.
+        """
+        s = self.settings
+        checks = deque()
+        pool = ThreadPoolExecutor(max_workers=DECODE_CHECK_WORKERS) if s.verify_existing == "decode" else None
+
+        try:
+            for item in self.reader:
+                yield from self._checked(checks)
+                if item is NOT_READY:
+                    yield NOT_READY
+                    continue
+                idx, row = item
+                article = _row_article(row, s)
+                if not article:
+                    continue
+
+                folder = os.path.join(self.base_folder, article)
+                os.makedirs(folder, exist_ok=True)
+
+                for j, col in enumerate(s.photo_cols, start=s.start_index):
+                    url = _cell_text(row[col]) if col < len(row) else None
+                    if not url:
+                        continue
+                    filename = _photo_filename(folder, article, j, s)
+                    self.total += 1
+                    existing = self.presence.find(filename, s.detect_format, self.written.get((idx, col)))
+                    photo = (idx, col, article, url, filename, existing)
+                    if existing and pool is not None:
+                        checks.append((pool.submit(_existing_valid, *self._existing_args(existing, url)), photo))
+                        continue
+                    valid = not existing or _existing_valid(*self._existing_args(existing, url))
+                    task = self._photo_task(photo, valid)
+                    if task is not None:
+                        yield task
+
+                while len(checks) >= DECODE_CHECK_BACKLOG:
+                    yield NOT_READY
+                    yield from self._checked(checks)
+
+            while checks:
+                yield NOT_READY
+                yield from self._checked(checks)
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        self.planned = True
+        self.close_if_finished()
+
+    def _checked(self, checks):
+        """Задачи для фото, проверка которых уже закончилась (по порядку строк)."""
+        while checks and checks[0][0].done():
+            future, photo = checks.popleft()
+            task = self._photo_task(photo, future.result())
+            if task is not None:
+                yield task
+
+    def _photo_task(self, photo, valid):
+        """Задача загрузки для фото или None, если качать не нужно (есть на диске, копия, дубликат)."""
+        s = self.settings
+        idx, col, article, url, filename, existing = photo
+        previous_url, previous_state, _ = self.previous.get((idx, col), (None, None, None))
+        written = self.written.get((idx, col))
+        damaged = bool(existing) and not valid
+        if damaged:
+            self.damaged += 1
+            self.log_callback(f"⚠️ Файл поврежден, будет скачан заново: {existing}")
+        resumed = _resumed(previous_url, previous_state, url, self.validators)
+        if existing and not damaged and (resumed or s.skip_existing):
+            skipped = PhotoTask(url, existing, "", idx, col, article=article)
+            if resumed:
+                self.skipped += 1
+            else:
+                self.present += 1
+                if self.manifest is not None:
+                    self.manifest.add_pending(skipped, "present")
+            self.done += 1
+            if self.run_log is not None:
+                self._record("skipped", skipped)
+            return None
+        task = PhotoTask(url, existing or filename, urlparse(url).netloc.lower(), idx, col,
+                         article=article, job=self, replaces=written)
+        if url in self.validators and not damaged:
+            etag, last_modified, length = self.validators[url]
+            # 304 означает "файл у вас есть" — только если он действительно цел
+            if self.presence.size(task.filename) == length:
+                task.etag, task.last_modified = etag, last_modified
+        if self.manifest is not None and (previous_url, previous_state) != (url, "pending"):
+            self.manifest.add_pending(task)
+
+        if self.content is not None:
+            primary = self.by_url.get(url)
+            if primary is not None and primary.state is None:
+                primary.copies.append(task)
+                return None
+            if primary is not None and primary.state == "done":
+                self._link_local(primary.filename, task)
+                self.done += 1
+                return None
+            source = self.content.local_copy(url) if not existing else None
+            if source is not None and (self.settings.detect_format
+                                       or source.lower().endswith(self.settings.extension)):
+                self._link_local(source, task)
+                self.done += 1
+                return None
+            self.by_url[url] = task
+        self.outstanding += 1
+        return task
+
+    def _fan_out(self, task, reason):
+        """Раскладывает результат задачи по всем строкам с той же ссылкой."""
+        for copy in task.copies:
+            if task.state == "done":
+                self._link_local(task.filename, copy)
+            else:
+                copy.state = task.state
+                if self.manifest is not None:
+                    self.manifest.mark(copy, copy.state, reason)
+                self._record("failed", copy, reason=reason)
+        self.done += len(task.copies)
+
+    def _rate_feedback(self, task, result, rate_limiter, error=None):
+        if result is None and not getattr(error, "markup", False):
+            rate_limiter.feedback(task.host, None)
+            return
+        if result is not None:
+            status, retry_after, what = result.status, result.retry_after, f"ответ {result.status}"
+        else:
+            # страница вместо фото — обычно капча: хост притормаживается, как после 429
+            status, retry_after, what = 429, None, "страница вместо фото"
+        pause = rate_limiter.feedback(task.host, status, retry_after)
+        if pause is not None:
+            self.log_callback(f"🐢 {task.host}: {what}, пауза {pause:.1f} сек")
+
+    def _count_quarantined(self, error):
+        if isinstance(error, InvalidImageError) and error.quarantine_path:
+            self.quarantined.add(error.quarantine_path)
+
+    def on_retry(self, task, result, error, delay, max_attempts, rate_limiter):
+        """Задача отложена на повтор: в итог она пока не попадает."""
+        reason = str(error) if error is not None else f"HTTP {result.status}"
+        self.log_callback(
+            f"🔁 {task.url}: {reason}; попытка {task.attempts + 1} из {max_attempts} через {delay:.1f} сек"
+        )
+        self._count_quarantined(error)
+        self._rate_feedback(task, result, rate_limiter, error)
+        self.retries += 1
+        if self.manifest is not None:
+            self.manifest.mark(task, "pending", reason)
+        self._record("retry", task, result, reason)
+
+    def on_result(self, task, result, error, rate_limiter):
+        log_callback = self.log_callback
+        if error is not None:
+            log_callback(f"❌ Ошибка при скачивании {task.url}: {error}")
+            state, reason = "failed", str(error)
+            self._count_quarantined(error)
+        else:
+            if result.status == 200:
+                log_callback(f"✅ {task.filename}")
+                state, reason = "done", None
+                if self.manifest is not None and self.settings.revalidate:
+                    self.manifest.store_validators(task.url, result.etag, result.last_modified, result.length)
+                if self.content is not None:
+                    self.content.add(task.url, result.sha256, task.filename, result.length)
+            elif result.status == 304:
+                log_callback(f"♻️ Не изменилось: {task.filename}")
+                state, reason = "done", None
+                self.unchanged += 1
+                self._record("unchanged", task, result)
+            else:
+                log_callback(f"⚠️ Ошибка {result.status}")
+                if result.text:
+                    log_callback(result.text)
+                log_callback(task.url)
+                state, reason = "failed", f"HTTP {result.status}"
+        self._rate_feedback(task, result, rate_limiter, error)
+        if state == "done" and task.attempts:
+            self.healed += 1
+        if state == "failed" or result.status == 200:
+            self._record(state, task, result, reason)
+
+        task.state = state
+        if self.manifest is not None:
+            self.manifest.mark(task, state, reason)
+        if task.copies:
+            self._fan_out(task, reason)
+
+        self.done += 1
+        self.outstanding -= 1
+        self.close_if_finished()
+
+    def close_if_finished(self):
+        if self.planned and not self.outstanding and not self.closed:
+            self.close()
+
+    def close(self):
+        """Закрывает манифест и пишет итог по файлу (один раз)."""
+        if self.closed:
+            return
+        self.closed = True
+        if self.manifest is not None:
+            self.manifest.close()
+
+        log_callback = self.log_callback
+        if self.reader is not None and self.reader.error is not None:
+            log_callback(f"❌ Ошибка при чтении {self.excel_path}: {self.reader.error}")
+
+        if self.total == 0:
+            log_callback(f"⚠️ Нет ссылок в файле: {self.excel_path}")
+            return
+
+        if self.skipped:
+            log_callback(f"⏭ Уже скачано в прошлый раз: {self.skipped} из {self.total}")
+        if self.present:
+            log_callback(f"⏭ Уже есть в папках и не скачивались: {self.present} из {self.total}")
+        if self.damaged:
+            log_callback(f"⚠️ Поврежденные файлы скачаны заново: {self.damaged}")
+        if self.unchanged:
+            log_callback(f"♻️ Не изменились на сервере и не скачивались повторно: {self.unchanged}")
+        if self.retries:
+            log_callback(f"🔁 Повторных попыток: {self.retries}, фото скачано после повтора: {self.healed}")
+        if self.quarantined:
+            log_callback(f"🧪 Ответов не-фото отложено в {QUARANTINE_FOLDER}: {len(self.quarantined)}")
+        if self.content is not None and (self.content.requests_saved or self.content.bytes_saved):
+            log_callback(
+                f"🔗 Дубликаты: сэкономлено запросов {self.content.requests_saved}, "
+                f"{self.content.bytes_saved / (1024 * 1024):.1f} МБ"
+            )
+        log_callback(f"🎉 Готово для {self.excel_path}!")
+
+
+def _round_robin(sources):
+    """Берет задачи из нескольких источников по очереди — каждому файлу своя доля."""
+    active = deque(iter(source) for source in sources)
+    idle = 0
+    while active:
+        source = active.popleft()
+        item = next(source, None)
+        if item is None:
+            continue
+        active.append(source)
+        if item is NOT_READY:
+            idle += 1
+            if idle >= len(active):
+                idle = 0
+                yield NOT_READY
+            continue
+        idle = 0
+        yield item
+
+
+def download_photos_batch(
+        excel_paths,
         article_col,
         photo_cols,
         progress_callback,
@@ -38,138 +2149,1105 @@ def download_photos(
         static_after="",
         delay_seconds=3,
         random_delay=False,
-        referer=""):
-    try:
-        df = pd.read_excel(excel_path, header=None)
-    except Exception as e:
-        log_callback(f"❌ Ошибка при чтении {excel_path}: {e}")
+        referer="",
+        max_workers=MAX_WORKERS,
+        per_host_limit=PER_HOST_LIMIT,
+        backend="threads",
+        per_host_streams=ASYNC_STREAMS_PER_HOST,
+        host_rate=None,
+        chunk_size=CHUNK_SIZE,
+        max_bytes=MAX_PHOTO_BYTES,
+        resume=True,
+        revalidate=True,
+        dedupe=True,
+        post_process=None,
+        convert_to=None,
+        retry_policy=None,
+        run_log=True,
+        metrics=None,
+        skip_existing=False,
+        verify_existing=None,
+        validate="magic"):
+    """Качает фото из нескольких Excel-файлов одновременно.
+
+    Все файлы подают задачи в общий планировщик по очереди, ограничения на
+    хост общие, прогресс — суммарный, итог пишется по каждому файлу отдельно.
+    per_host_limit — соединений (и запросов) к одному хосту; asyncio-бэкенд
+    хосту с HTTP/2 шлет до per_host_streams запросов поверх этих соединений.
+    convert_to ("jpg", "png", "webp") — сразу сохранять фото в этом формате,
+    без отдельного прохода конвертора. Временные ошибки повторяются по
+    retry_policy (по умолчанию RetryPolicy()) в конце запуска. С run_log исход
+    каждой ссылки и итог пишутся в RUN_LOG_FOLDER рядом с первым Excel-файлом.
+    Время этапов копится в metrics (StageMetrics; создается, если не передан).
+    skip_existing: фото, файл которого уже есть в папке артикула, не запрашивается
+    (папка читается один раз); verify_existing ("size", "decode") — сначала
+    проверить такой файл, поврежденный скачивается заново.
+    validate ("magic", "verify" или None) — проверка каждого скачанного тела
+    (см. PAYLOAD_CHECKS): не-фото уходят в QUARANTINE_FOLDER и повторяются.
+    """
+    if verify_existing is not None and verify_existing not in EXISTING_CHECKS:
+        log_callback(f"❌ Неизвестная проверка файлов: {verify_existing}")
         return
+    if validate is not None and validate not in PAYLOAD_CHECKS:
+        log_callback(f"❌ Неизвестная проверка загрузок: {validate}")
+        return
+    if backend == "async" and httpx is None:
+        log_callback("⚠️ httpx не установлен, используется загрузка потоками")
+        backend = "threads"
+
+    target_format = None
+    if convert_to:
+        target_format = _pil_format(convert_to)
+        if target_format is None:
+            log_callback(f"❌ Неподдерживаемый формат: {convert_to}")
+            return
+
+    settings = _download_settings(article_col, photo_cols, article_suffix, start_index,
+                                  static_before, static_after, resume, revalidate, dedupe, convert_to,
+                                  skip_existing, verify_existing)
+    journal = None
+    if run_log and excel_paths:
+        try:
+            journal = RunLog(os.path.join(os.path.dirname(excel_paths[0]), RUN_LOG_FOLDER))
+        except OSError as e:
+            log_callback(f"⚠️ Журнал запуска не создан: {e}")
+
+    jobs = []
+    for idx, path in enumerate(excel_paths, start=1):
+        log_callback(f"📂 Обработка файла ({idx}/{len(excel_paths)}): {path}")
+        job = ExcelJob(path, settings, log_callback, journal)
+        if job.open():
+            jobs.append(job)
+    if not jobs:
+        if journal is not None:
+            journal.close(log_callback)
+        return
+
+    rate_limiter = HostRateLimiter(delay_seconds, random_delay, host_rate)
+    scheduler = HostScheduler(per_host_limit, rate_limiter)
+    max_workers = max(1, max_workers)
+    if metrics is None:
+        metrics = StageMetrics()
+    options = FetchOptions(referer, chunk_size, max_bytes, target_format, metrics, validate)
+
+    def report_progress():
+        progress_callback(sum(job.done for job in jobs), sum(job.total for job in jobs))
+
+    if retry_policy is None:
+        retry_policy = RetryPolicy()
+
+    def on_result(task, result, error):
+        delay = retry_policy.retry_delay(task, result, error)
+        if delay is not None:
+            # не мешаем остальным: задача вернется в очередь, когда основная работа закончится
+            task.attempts += 1
+            task.job.on_retry(task, result, error, delay, retry_policy.max_attempts, rate_limiter)
+            scheduler.defer(task, delay)
+            return
+        task.job.on_result(task, result, error, rate_limiter)
+        report_progress()
+
+    last_stats = time.monotonic()
+
+    def pipeline_stats(fetching, depths):
+        nonlocal last_stats
+        now = time.monotonic()
+        if now - last_stats < PIPELINE_LOG_EVERY:
+            return
+        last_stats = now
+        rows_queued = sum(job.reader.queue.qsize() for job in jobs)
+        log_callback(
+            f"📊 Очереди: строки {rows_queued}, к загрузке {len(scheduler)}, "
+            f"загружается {fetching}, запись {depths['запись']}, обработка {depths['обработка']}"
+        )
+        stages = metrics.summary_line()
+        if stages:
+            log_callback(f"⏱ Этапы: {stages}")
+        if len(jobs) > 1:
+            for job in jobs:
+                if not job.closed:
+                    log_callback(f"📄 {os.path.basename(job.excel_path)}: {job.done}/{job.total}")
+
+    # очередь планировщика пополняется из plan() по мере освобождения — загрузка
+    # начинается сразу, не дожидаясь чтения всего файла
+    scheduler.feed(_round_robin(job.plan() for job in jobs), low_water=max_workers * 4)
+
+    try:
+        if backend == "async":
+            _download_async(scheduler, max_workers, scheduler.per_host_limit, max(1, per_host_streams), options,
+                            on_result, pipeline_stats, post_process)
+        else:
+            configure_session(max_workers, per_host_limit)
+            _download_threaded(scheduler, max_workers, options, on_result, pipeline_stats, post_process)
+    finally:
+        for job in jobs:
+            job.close()
+        metrics.log_summary(log_callback)
+        if journal is not None:
+            journal.close(log_callback, metrics)
+
+    report_progress()
+
+
+def download_photos(excel_path, *args, **kwargs):
+    """Качает фото из одного Excel-файла; параметры — как у download_photos_batch."""
+    download_photos_batch([excel_path], *args, **kwargs)
+
+
+# --- План загрузки (без сети и записи на диск) ---
+# Сколько секунд на фото считать, если прошлых запусков нет
+PLAN_DEFAULT_LATENCY = 0.5
+
+
+@dataclass
+class DownloadPlan:
+    """Что сделает download_photos_batch с этими параметрами; execute() запускает загрузку."""
+    excel_paths: list
+    article_col: int
+    photo_cols: list
+    options: dict
+    links: int = 0
+    articles: int = 0
+    # скачаны в прошлый раз и пропускаются (resume; с сохраненным ETag — условный запрос)
+    skipped: int = 0
+    # уже есть в папке и пропускаются (skip_existing)
+    present: int = 0
+    # найдены, но не прошли проверку verify_existing
+    damaged: int = 0
+    # файл уже лежит в папке артикула, но будет запрошен снова
+    on_disk: int = 0
+    # из них с условным запросом (ETag / Last-Modified)
+    conditional: int = 0
+    # ссылка уже встречалась в этом файле
+    duplicates: int = 0
+    # байты этой ссылки уже на диске с прошлых запусков
+    local_copies: int = 0
+    invalid: list = field(default_factory=list)
+    hosts: dict = field(default_factory=dict)
+    # хост -> секунд на фото по прошлому запуску
+    latency: dict = field(default_factory=dict)
+    photo_bytes: float = None
+    history: str = None
+    elapsed: float = 0.0
+
+    @property
+    def requests(self):
+        return sum(self.hosts.values()) + len(self.invalid)
+
+    def estimate_seconds(self):
+        """Оценка длительности: самый загруженный хост или общий лимит потоков, что дольше."""
+        max_workers = max(1, self.options.get("max_workers", MAX_WORKERS))
+        per_host_limit = max(1, self.options.get("per_host_limit", PER_HOST_LIMIT))
+        host_rate = self.options.get("host_rate")
+        default = (sum(self.latency.values()) / len(self.latency)) if self.latency else PLAN_DEFAULT_LATENCY
+        busiest = work = 0.0
+        for host, count in self.hosts.items():
+            latency = self.latency.get(host, default)
+            host_seconds = count * latency / per_host_limit
+            if host_rate:
+                host_seconds = max(host_seconds, count / host_rate)
+            busiest = max(busiest, host_seconds)
+            work += count * latency
+        return max(busiest, work / max_workers)
+
+    def log(self, log_callback, top_hosts=10):
+        log_callback(
+            f"📋 План: файлов Excel {len(self.excel_paths)}, артикулов {self.articles}, "
+            f"ссылок {self.links} (составлен за {self.elapsed:.1f} сек)"
+        )
+        if self.skipped:
+            log_callback(f"⏭ Уже скачано в прошлый раз: {self.skipped}")
+        if self.present:
+            log_callback(f"⏭ Уже есть в папках, не будут скачаны: {self.present}")
+        if self.damaged:
+            log_callback(f"⚠️ Повреждены, будут скачаны заново: {self.damaged}")
+        if self.on_disk:
+            log_callback(f"📁 Уже на диске, но будут запрошены снова: {self.on_disk}"
+                         + (f" (условным запросом: {self.conditional})" if self.conditional else ""))
+        if self.duplicates or self.local_copies:
+            log_callback(f"🔗 Без запроса: повторы ссылок {self.duplicates}, "
+                         f"копии с прошлых запусков {self.local_copies}")
+        hosts = sorted(self.hosts.items(), key=lambda item: -item[1])
+        log_callback(f"🌐 Запросов: {self.requests} к {len(hosts)} сайтам"
+                     + (": " + ", ".join(f"{host} {count}" for host, count in hosts[:top_hosts]) if hosts else ""))
+        if self.invalid:
+            log_callback(f"⚠️ Не похожи на ссылки: {len(self.invalid)}, например: {', '.join(self.invalid[:3])}")
+        if self.hosts:
+            seconds = self.estimate_seconds()
+            size = (f", ~{self.photo_bytes * sum(self.hosts.values()) / (1024 * 1024):.0f} МБ"
+                    if self.photo_bytes else "")
+            source = (f"по прошлому запуску {os.path.basename(self.history)}" if self.history
+                      else f"по {PLAN_DEFAULT_LATENCY} сек на фото")
+            log_callback(f"⏱ Оценка: ~{_format_duration(seconds)}{size} ({source}, без пауз после блокировок)")
+
+    def execute(self, progress_callback, log_callback):
+        download_photos_batch(self.excel_paths, self.article_col, self.photo_cols,
+                              progress_callback, log_callback, **self.options)
+
+
+def _format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f} сек"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} мин"
+    return f"{seconds / 3600:.1f} ч"
+
+
+def _last_run_summary(excel_paths):
+    """(путь, итог) последнего запуска из RUN_LOG_FOLDER рядом с первым Excel-файлом."""
+    if not excel_paths:
+        return None, None
+    summaries = glob.glob(os.path.join(os.path.dirname(excel_paths[0]), RUN_LOG_FOLDER, "run-*.summary.json"))
+    if not summaries:
+        return None, None
+    path = max(summaries, key=os.path.getmtime)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return path, json.load(f)
+    except (OSError, ValueError):
+        return None, None
+
+
+def plan_download(excel_paths, article_col, photo_cols, log_callback, **options):
+    """Проходит Excel-файлы так же, как download_photos_batch, но ничего не качает и не пишет.
+
+    options — те же именованные параметры, что у download_photos_batch; с ними
+    же план потом запускается через execute().
+    """
+    started = time.perf_counter()
+    plan = DownloadPlan(list(excel_paths), article_col, photo_cols, options)
+    settings = _download_settings(article_col, photo_cols, **options)
+    hosts = defaultdict(int)
+    articles = set()
+
+    def photos(rows, base_folder, presence, written, validators):
+        for idx, row in rows:
+            article = _row_article(row, settings)
+            if not article:
+                continue
+            articles.add((base_folder, article))
+            folder = os.path.join(base_folder, article)
+            for j, col in enumerate(settings.photo_cols, start=settings.start_index):
+                url = _cell_text(row[col]) if col < len(row) else None
+                if not url:
+                    continue
+                plan.links += 1
+                existing = presence.find(_photo_filename(folder, article, j, settings), settings.detect_format,
+                                         written.get((idx, col)))
+                length = validators[url][2] if url in validators else None
+                args = (existing, settings.verify_existing, presence.size(existing), length) if existing else None
+                yield (idx, col, url, existing, length), args
+
+    for path in plan.excel_paths:
+        try:
+            rows = iter_excel_rows(path)
+        except Exception as e:
+            log_callback(f"❌ Ошибка при чтении {path}: {e}")
+            continue
+        manifest = content = None
+        previous, written, validators = {}, {}, {}
+        if os.path.exists(DownloadManifest.path_for(path)):
+            try:
+                manifest = DownloadManifest(path, read_only=True)
+                previous = manifest.load()
+                written = _written_files(previous)
+                previous = previous if settings.resume else {}
+                validators = manifest.load_validators() if settings.revalidate else {}
+                content = ContentStore(manifest) if settings.dedupe else None
+            except sqlite3.Error as e:
+                log_callback(f"⚠️ Манифест {path} недоступен: {e}")
+        if content is None and settings.dedupe:
+            content = ContentStore()
+        base_folder = os.path.dirname(path)
+        presence = PresenceIndex()
+        seen = set()
+
+        try:
+            # проверка найденных файлов (decode) идет в пуле, как при загрузке
+            for (idx, col, url, existing, length), valid in _checked_in_order(
+                    photos(rows, base_folder, presence, written, validators), settings.verify_existing):
+                damaged = bool(existing) and not valid
+                plan.damaged += damaged
+                previous_url, previous_state, _ = previous.get((idx, col), (None, None, None))
+                if existing and not damaged and _resumed(previous_url, previous_state, url, validators):
+                    plan.skipped += 1
+                    continue
+                if existing and not damaged and settings.skip_existing:
+                    plan.present += 1
+                    continue
+                if content is not None:
+                    if url in seen:
+                        plan.duplicates += 1
+                        continue
+                    seen.add(url)
+                    if not existing and content.local_copy(url) is not None:
+                        plan.local_copies += 1
+                        continue
+                if existing:
+                    plan.on_disk += 1
+                    if not damaged and length is not None and presence.size(existing) == length:
+                        plan.conditional += 1
+                parsed = urlparse(url)
+                if parsed.scheme not in ("http", "https") or not parsed.netloc:
+                    plan.invalid.append(url)
+                    continue
+                hosts[parsed.netloc.lower()] += 1
+        except Exception as e:
+            log_callback(f"❌ Ошибка при чтении {path}: {e}")
+        finally:
+            if manifest is not None:
+                manifest.close()
+
+    plan.hosts = dict(hosts)
+    plan.articles = len(articles)
+    plan.history, summary = _last_run_summary(plan.excel_paths)
+    if summary is not None:
+        for host, stats in summary.get("hosts", {}).items():
+            if stats.get("requests") and stats.get("p50_ms") is not None:
+                plan.latency[host] = stats["p50_ms"] / 1000
+        done = summary.get("counts", {}).get("done", 0)
+        if done:
+            plan.photo_bytes = summary.get("bytes", 0) / done
+    plan.elapsed = time.perf_counter() - started
+    plan.log(log_callback)
+    return plan
+
+
+# --- Бенчмарк бэкендов загрузки ---
+def benchmark_backends(photos=2000, payload_kb=200, latency_ms=50, hosts=8,
+                       in_flight=64, per_host_limit=None, log_callback=print):
+    """Сравнивает потоки и asyncio на локальных HTTP-серверах с искусственной задержкой.
+
+    Каждый сервер слушает свой порт и изображает отдельный хост CDN. Оба
+    бэкенда получают одинаковый бюджет: in_flight потоков или запросов в
+    полете и per_host_limit на хост (по умолчанию — весь бюджет, чтобы
+    сравнивались бэкенды, а не лимит на хост). Прогон повторяется для hosts
+    хостов и для одного хоста.
+    """
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    payload = os.urandom(payload_kb * 1024)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency_ms / 1000)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    servers = [Server(("127.0.0.1", 0), Handler) for _ in range(max(1, hosts))]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_urls = [f"http://127.0.0.1:{server.server_address[1]}" for server in servers]
+    in_flight = max(1, in_flight)
+    per_host_limit = per_host_limit or in_flight
+
+    backends = ["threads"]
+    if httpx is not None:
+        backends.append("async")
+    else:
+        log_callback("⚠️ httpx не установлен, asyncio-бэкенд пропущен")
+
+    per_row = 5
+    try:
+        for host_count in sorted({len(base_urls), 1}, reverse=True):
+            urls = base_urls[:host_count]
+            rows = [[f"bench{i}"] + [f"{urls[(i + j) % len(urls)]}/{i}_{j}.jpg" for j in range(per_row)]
+                    for i in range(max(1, photos // per_row))]
+            total = len(rows) * per_row
+            for backend in backends:
+                with tempfile.TemporaryDirectory() as tmp:
+                    excel_path = os.path.join(tmp, "bench.xlsx")
+                    pd.DataFrame(rows).to_excel(excel_path, header=False, index=False)
+                    started = time.perf_counter()
+                    download_photos(excel_path, 0, list(range(1, per_row + 1)),
+                                    lambda done, total: None, lambda msg: None,
+                                    delay_seconds=0, max_workers=in_flight,
+                                    per_host_limit=per_host_limit, per_host_streams=per_host_limit,
+                                    backend=backend, resume=False, validate=None)
+                    elapsed = time.perf_counter() - started
+                log_callback(
+                    f"⏱ {backend}: {total} фото с {host_count} хост(ов), {in_flight} в полете, "
+                    f"до {per_host_limit} на хост, за {elapsed:.2f} сек "
+                    f"({total / elapsed:.0f} фото/сек, {total * payload_kb / 1024 / elapsed:.1f} МБ/сек)"
+                )
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+# --- Индекс файлов папки ---
+# Папке, измененной только что, mtime не верим: запись в тот же тик таймера
+# его не сдвинет. На FAT и сетевых дисках mtime в целых секундах — окно шире
+FOLDER_MTIME_SLACK_NS = 50_000_000
+FOLDER_MTIME_COARSE_SLACK_NS = 2_000_000_000
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+# Этим файлом generate_renditions помечает свои папки превью. Имя вида
+# "600x600" ничего не значит — так бывают названы и папки артикулов
+RENDITION_MARKER = ".renditions"
+
+
+@dataclass
+class FileEntry:
+    path: str
+    ext: str
+    size: int
+    mtime_ns: int
+
+
+def _file_entry(path, dir_entry=None):
+    """FileEntry файла или None, если его уже нет.
+
+    С dir_entry размер и mtime берутся из os.scandir (на Windows — без обращения
+    к диску, на других системах — один stat, дальше из кэша DirEntry), без него —
+    свежие, из os.stat.
+    """
+    try:
+        stat = dir_entry.stat() if dir_entry is not None else os.stat(path)
+    except OSError:
+        return None
+    return FileEntry(path, os.path.splitext(path)[1].lower(), stat.st_size, stat.st_mtime_ns)
+
+
+@dataclass
+class _FolderState:
+    mtime_ns: int = None
+    # имя → DirEntry из scandir (None — файл добавлен операцией)
+    files: dict = field(default_factory=dict)
+    subdirs: set = field(default_factory=set)
+    touched: bool = False
+    # папка превью (в ней лежит RENDITION_MARKER)
+    renditions: bool = False
+
+
+def _settled_mtime(mtime_ns):
+    """mtime папки, если ему можно верить, иначе None (папку прочитать снова)."""
+    slack = FOLDER_MTIME_COARSE_SLACK_NS if mtime_ns % 1_000_000_000 == 0 else FOLDER_MTIME_SLACK_NS
+    return None if time.time_ns() - mtime_ns < slack else mtime_ns
+
+
+class FolderIndex:
+    """Файлы папки и всех подпапок, прочитанные за один проход os.scandir.
+
+    refresh() перечитывает только папки, у которых изменился mtime, остальные
+    берет из памяти. Операции сами сообщают о созданных, удаленных и
+    перемещенных файлах через add/remove/move: такие папки не перечитываются,
+    если до операции индекс с ними совпадал.
+
+    paths() отдает только пути — удалению и группировке размеры не нужны.
+    files() и size() берут размер и mtime из DirEntry сканирования. Перезапись
+    файла на месте mtime папки не меняет, поэтому там, где важна свежесть
+    (инкрементальная конвертация, превью), get() каждый раз делает os.stat.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._folders = {}
+        self._lock = threading.RLock()
+        self.scanned = 0
+
+    def _scan(self, path, mtime_ns):
+        state = _FolderState(_settled_mtime(mtime_ns))
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        state.subdirs.add(entry.name)
+                    elif entry.name == RENDITION_MARKER:
+                        state.renditions = True
+                    elif entry.is_file():
+                        state.files[entry.name] = entry
+                except OSError:
+                    continue
+        self.scanned += 1
+        return state
+
+    def refresh(self):
+        """Обходит дерево, читая заново только измененные папки; возвращает self."""
+        with self._lock:
+            seen = set()
+            stack = [self.root]
+            while stack:
+                path = stack.pop()
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+                state = self._folders.get(path)
+                if state is not None and state.touched:
+                    # изменения операции уже в индексе — принимаем новый mtime
+                    state.touched = False
+                    if state.mtime_ns is not None:
+                        state.mtime_ns = _settled_mtime(mtime_ns)
+                if state is None or state.mtime_ns is None or state.mtime_ns != mtime_ns:
+                    try:
+                        state = self._folders[path] = self._scan(path, mtime_ns)
+                    except OSError:
+                        continue
+                seen.add(path)
+                stack.extend(os.path.join(path, name) for name in state.subdirs)
+            for path in set(self._folders) - seen:
+                del self._folders[path]
+        return self
+
+    def in_renditions(self, folder):
+        """Лежит ли папка в папке превью (помеченной RENDITION_MARKER) ниже корня."""
+        folder = os.path.abspath(folder)
+        with self._lock:
+            while folder != self.root and os.path.dirname(folder) != folder:
+                state = self._folders.get(folder)
+                if state is not None and state.renditions:
+                    return True
+                folder = os.path.dirname(folder)
+        return False
+
+    def _select(self, extensions, folder, skip_renditions):
+        with self._lock:
+            if folder is None:
+                folders = list(self._folders.items())
+            else:
+                folder = os.path.abspath(folder)
+                folders = [(folder, self._folders.get(folder))]
+            if skip_renditions:
+                folders = [(path, state) for path, state in folders if not self.in_renditions(path)]
+            return [(os.path.join(path, name), dir_entry) for path, state in folders if state is not None
+                    for name, dir_entry in state.files.items()
+                    if extensions is None or os.path.splitext(name)[1].lower() in extensions]
+
+    def paths(self, extensions=None, folder=None, skip_renditions=False):
+        """Пути файлов без обращения к диску; extensions — кортеж расширений с
+        точкой в нижнем регистре. skip_renditions — без файлов из папок превью
+        (их делает generate_renditions, это не исходники)."""
+        return [path for path, _ in self._select(extensions, folder, skip_renditions)]
+
+    def files(self, extensions=None, folder=None, skip_renditions=False):
+        """Список FileEntry с размером и mtime из сканирования; параметры — как у paths()."""
+        entries = (_file_entry(path, dir_entry) for path, dir_entry in self._select(extensions, folder, skip_renditions))
+        return [entry for entry in entries if entry is not None]
+
+    def size(self, path):
+        """Размер файла из сканирования или None, если его нет в индексе."""
+        folder, name = os.path.split(os.path.abspath(path))
+        with self._lock:
+            state = self._folders.get(folder)
+            if state is None or name not in state.files:
+                return None
+            dir_entry = state.files[name]
+        entry = _file_entry(os.path.join(folder, name), dir_entry)
+        return entry.size if entry is not None else None
+
+    def names(self, folder):
+        """Имена файлов и подпапок в папке."""
+        with self._lock:
+            state = self._folders.get(os.path.abspath(folder))
+            return set() if state is None else set(state.files) | state.subdirs
+
+    def get(self, path):
+        """FileEntry файла со свежими размером и mtime или None, если его нет в индексе."""
+        path = os.path.abspath(path)
+        folder, name = os.path.split(path)
+        with self._lock:
+            state = self._folders.get(folder)
+            if state is None or name not in state.files:
+                return None
+        return _file_entry(path)
+
+    def add(self, path):
+        """Добавляет файл, созданный операцией; новая папка читается при refresh()."""
+        path = os.path.abspath(path)
+        if not os.path.isfile(path):
+            self.remove(path)
+            return
+        self._put(path)
+
+    def _put(self, path):
+        folder, name = os.path.split(path)
+        with self._lock:
+            state = self._folders.get(folder)
+            if state is None:
+                parent, child = os.path.split(folder)
+                if parent in self._folders:
+                    self._folders[parent].subdirs.add(child)
+                state = self._folders[folder] = _FolderState()
+            if name == RENDITION_MARKER:
+                state.renditions = True
+            else:
+                state.files[name] = None
+            state.touched = True
+
+    def remove(self, path):
+        folder, name = os.path.split(os.path.abspath(path))
+        with self._lock:
+            state = self._folders.get(folder)
+            if state is not None:
+                state.files.pop(name, None)
+                state.touched = True
+
+    def move(self, old_path, new_path):
+        """Переносит файл, который операция уже переместила на диске (без проверки os.stat)."""
+        with self._lock:
+            self.remove(old_path)
+            self._put(os.path.abspath(new_path))
+
 
-    total_photos = sum(df[c].notna().sum() for c in photo_cols if c < len(df.columns))
-    done_photos = 0
+_folder_indexes = {}
+_folder_indexes_lock = threading.Lock()
 
-    if total_photos == 0:
-        log_callback(f"⚠️ Нет ссылок в файле: {excel_path}")
+
+def folder_index(folder):
+    """Индекс папки, общий для конвертации, превью, удаления и группировки в этой сессии."""
+    key = os.path.normcase(os.path.abspath(folder))
+    with _folder_indexes_lock:
+        index = _folder_indexes.get(key)
+        if index is None:
+            index = _folder_indexes[key] = FolderIndex(folder)
+    return index.refresh()
+
+
+# --- Конвертор изображений (рекурсивный) ---
+# Сколько файлов отдавать процессу за раз: меньше накладных расходов на передачу
+CONVERT_CHUNK_SIZE = 16
+CONVERT_INDEX_NAME = ".convert_index.sqlite"
+
+
+def _map_in_processes(func, items, args, report, workers=None, chunk_size=CONVERT_CHUNK_SIZE):
+    """Вызывает func(chunk, *args) для пачек items в пуле процессов.
+
+    Результаты каждой пачки передаются в report в вызывающем потоке. С одним
+    процессом или одной пачкой пул не создается.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    chunk_size = max(1, chunk_size)
+    chunks = (items[i:i + chunk_size] for i in range(0, len(items), chunk_size))
+
+    if workers == 1 or len(items) <= chunk_size:
+        for chunk in chunks:
+            report(func(chunk, *args))
         return
 
-    base_folder = os.path.dirname(excel_path)
+    # декодирование и кодирование упираются в CPU — каждому ядру свой процесс;
+    # в очереди держим не больше двух пачек на процесс
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(func, chunk, *args))
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    report(future.result())
+        for future in as_completed(pending):
+            report(future.result())
 
-    for idx, row in df.iterrows():
-        article_val = row[article_col] if article_col < len(row) else None
-        if pd.isna(article_val):
-            continue
-        article = str(article_val).strip().replace(".0", "")
-        if not article:
-            continue
 
-        folder = os.path.join(base_folder, article)
-        os.makedirs(folder, exist_ok=True)
+def _pil_format(target_format):
+    """Имя формата для PIL ("jpg" → "JPEG") или None, если формат не поддерживается."""
+    supported_formats = ["PNG", "JPEG", "WEBP"]
+    target_format_upper = target_format.upper()
+    if target_format_upper == "JPG":
+        target_format_upper = "JPEG"
+    return target_format_upper if target_format_upper in supported_formats else None
 
-        for j, col in enumerate(photo_cols, start=start_index):
-            if col >= len(row):
-                continue
-            url = row[col]
-            if pd.notna(url):
-                try:
-                    headers = {}
 
-                    if referer.strip():
-                        headers["Referer"] = referer.strip()
+def _target_extensions(target_format):
+    target_format = target_format.lower()
+    return (".jpg", ".jpeg") if target_format in ("jpg", "jpeg") else (f".{target_format}",)
+
+
+def _convert_one(full_path, target_format, target_format_upper, with_digest=False):
+    name, ext = os.path.splitext(os.path.basename(full_path))
+    digest = None
+    if with_digest:
+        with open(full_path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        source = io.BytesIO(data)
+    else:
+        source = full_path
+    with Image.open(source) as img:
+        new_file = os.path.join(os.path.dirname(full_path), f"{name}.{target_format.lower()}")
+        img.convert("RGB").save(new_file, target_format_upper)
+    return new_file, digest
+
 
-                    r = session.get(
-                        url,
-                        headers=headers,
-                        timeout=(10, 30),
-                        allow_redirects=True
-                    )
+def _convert_chunk(paths, target_format, target_format_upper, with_digest=False):
+    """Конвертирует пачку файлов (в дочернем процессе). Ошибки возвращаются строкой."""
+    results = []
+    for full_path in paths:
+        try:
+            new_file, digest = _convert_one(full_path, target_format, target_format_upper, with_digest)
+            results.append((full_path, new_file, None, digest))
+        except Exception as e:
+            results.append((full_path, None, str(e), None))
+    return results
 
-                    if r.status_code == 200:
-                        filename = os.path.join(
-                            folder,
-                            f"{article}{article_suffix}{static_before}_{static_after}{j}.jpg"
-                        )
 
-                        with open(filename, "wb") as f:
-                            f.write(r.content)
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-                        log_callback(f"✅ {filename}")
-                        done_photos += 1
-                        progress_callback(done_photos, total_photos)
 
-                    else:
-                        log_callback(f"⚠️ Ошибка {r.status_code}")
+class ConversionIndex:
+    """SQLite-файл в папке с фото: размер, mtime и sha256 уже сконвертированных исходников.
 
-                        try:
-                            txt = r.text[:500].replace("\n", " ")
-                            if txt:
-                                log_callback(txt)
-                        except Exception:
-                            pass
+    Позволяет не конвертировать заново файл, которому только поменяли дату
+    (копирование, распаковка архива), если его содержимое не изменилось.
+    read_only — только чтение существующего индекса (для плана): unchanged()
+    не обновляет дату файла, ничего не записывается.
+    """
 
-                        log_callback(url)
+    def __init__(self, base_folder, target_format, read_only=False):
+        self.base_folder = base_folder
+        self.target = _target_extensions(target_format)[0]
+        self.read_only = read_only
+        path = os.path.join(base_folder, CONVERT_INDEX_NAME)
+        if read_only:
+            self._conn = _connect_read_only(path)
+        else:
+            self._conn = sqlite3.connect(path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS converted ("
+                " path TEXT, target TEXT, size INTEGER, mtime_ns INTEGER, sha256 TEXT,"
+                " PRIMARY KEY (path, target))"
+            )
+        cur = self._conn.execute(
+            "SELECT path, size, mtime_ns, sha256 FROM converted WHERE target = ?", (self.target,)
+        )
+        self._records = {path: (size, mtime_ns, sha) for path, size, mtime_ns, sha in cur}
 
-                except Exception as e:
-                    log_callback(f"❌ Ошибка при скачивании {url}: {e}")
+    def _key(self, full_path):
+        return os.path.relpath(full_path, self.base_folder)
 
-    delay = delay_seconds
+    def unchanged(self, entry):
+        """True, если исходник (FileEntry) не менялся с прошлой конвертации."""
+        full_path = entry.path
+        record = self._records.get(self._key(full_path))
+        if record is None:
+            return False
+        size, mtime_ns, sha = record
+        if (entry.size, entry.mtime_ns) == (size, mtime_ns):
+            return True
+        if entry.size != size:
+            return False
+        # размер тот же, дата другая — решает содержимое
+        if _file_sha256(full_path) != sha:
+            return False
+        if not self.read_only:
+            self.store(full_path, sha)
+        return True
 
-    if random_delay:
-        delay = random.uniform(
-            max(1, delay_seconds * 0.7),
-            delay_seconds * 1.3
+    def store(self, full_path, sha):
+        stat = os.stat(full_path)
+        key = self._key(full_path)
+        self._records[key] = (stat.st_size, stat.st_mtime_ns, sha)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO converted (path, target, size, mtime_ns, sha256) VALUES (?, ?, ?, ?, ?)",
+            (key, self.target, stat.st_size, stat.st_mtime_ns, sha)
         )
 
-    log_callback(f"⏳ Пауза {delay:.1f} сек")
-    time.sleep(delay)
+    def close(self):
+        if not self.read_only:
+            self._conn.commit()
+        self._conn.close()
 
-    log_callback(f"🎉 Готово для {excel_path}!")
 
+def _is_converted(path, target_extensions, files, index):
+    """Есть ли у файла свежий сконвертированный сосед (name.<target>) в индексе папки files.
 
-# --- Конвертор изображений (рекурсивный) ---
-def convert_images_recursive(base_folder, target_format, log_callback, progress_callback):
+    Исходник и сосед читаются через os.stat (files.get), только если сосед есть.
+    """
+    stem = os.path.splitext(path)[0]
+    for ext in target_extensions:
+        target = files.get(stem + ext)
+        if target is None or target.size == 0:
+            continue
+        entry = files.get(path)
+        if entry is None:
+            return False
+        if index is not None:
+            return index.unchanged(entry)
+        return target.mtime_ns >= entry.mtime_ns
+    return False
+
+
+def _convert_candidates(files, target_extensions, incremental, index):
+    """Пути файлов индекса папки, которые нужно конвертировать, и сколько пропущено."""
+    images = []
+    skipped = 0
+    for path in files.paths(PHOTO_EXTENSIONS, skip_renditions=True):
+        if incremental and (os.path.splitext(path)[1].lower() in target_extensions
+                            or _is_converted(path, target_extensions, files, index)):
+            skipped += 1
+            continue
+        images.append(path)
+    return images, skipped
+
+
+def convert_images_recursive(base_folder, target_format, log_callback, progress_callback,
+                             workers=None, chunk_size=CONVERT_CHUNK_SIZE, incremental=True, hash_index=False):
+    """Конвертирует все фото в папке и подпапках в target_format.
+
+    incremental: пропускать файлы, уже имеющие нужный формат, и те, у которых
+    рядом лежит сконвертированная копия новее исходника.
+    hash_index: вместо сравнения дат вести в папке индекс (CONVERT_INDEX_NAME)
+    с размером, mtime и sha256 исходников.
+    """
     if not os.path.isdir(base_folder):
         log_callback(f"❌ Папка не найдена: {base_folder}")
         return
 
-    supported_formats = ["PNG", "JPEG", "WEBP"]
-    target_format_upper = target_format.upper()
-    if target_format_upper == "JPG":
-        target_format_upper = "JPEG"
-    if target_format_upper not in supported_formats:
+    target_format_upper = _pil_format(target_format)
+    if target_format_upper is None:
         log_callback(f"❌ Неподдерживаемый формат: {target_format}")
         return
 
-    images = []
-    for root, dirs, files in os.walk(base_folder):
-        for file in files:
-            if file.lower().endswith(("png", "jpg", "jpeg", "webp")):
-                images.append(os.path.join(root, file))
+    target_extensions = _target_extensions(target_format)
+    index = ConversionIndex(base_folder, target_format) if incremental and hash_index else None
+    files = folder_index(base_folder)
+    images, skipped = _convert_candidates(files, target_extensions, incremental, index)
+
+    if skipped:
+        log_callback(f"⏭ Без изменений, пропущено: {skipped}")
 
     total = len(images)
     done = 0
+    with_digest = index is not None
 
-    for full_path in images:
-        try:
-            name, ext = os.path.splitext(os.path.basename(full_path))
-            with Image.open(full_path) as img:
-                new_file = os.path.join(os.path.dirname(full_path), f"{name}.{target_format.lower()}")
-                img.convert("RGB").save(new_file, target_format_upper)
+    def report(results):
+        nonlocal done
+        for full_path, new_file, error, digest in results:
+            if error is None:
                 log_callback(f"✅ {full_path} → {new_file}")
-        except Exception as e:
-            log_callback(f"⚠️ {full_path} нельзя конвертировать: {e}")
-        done += 1
+                files.add(new_file)
+                if index is not None:
+                    index.store(full_path, digest)
+            else:
+                log_callback(f"⚠️ {full_path} нельзя конвертировать: {error}")
+            done += 1
         progress_callback(done, total)
 
+    try:
+        _map_in_processes(_convert_chunk, images, (target_format, target_format_upper, with_digest),
+                          report, workers, chunk_size)
+    finally:
+        if index is not None:
+            index.close()
+
     log_callback(f"🎉 Конвертация завершена. Всего файлов конвертировано: {done}")
 
 
+def benchmark_conversion(images=200, size=(2000, 1500), worker_counts=None, log_callback=print):
+    """Меряет скорость конвертации webp → jpg при разном числе процессов."""
+    import tempfile
+
+    cpu_count = os.cpu_count() or 1
+    if worker_counts is None:
+        worker_counts = sorted({1, 2, 4, 8, 16, cpu_count} & set(range(1, cpu_count + 1)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sample = Image.effect_noise(size, 64).convert("RGB")
+        for i in range(images):
+            folder = os.path.join(tmp, f"art{i % 20}")
+            os.makedirs(folder, exist_ok=True)
+            sample.save(os.path.join(folder, f"art{i}_1.webp"), "WEBP")
+
+        base = None
+        for workers in worker_counts:
+            for file in glob.glob(os.path.join(tmp, "*", "*.jpg")):
+                os.remove(file)
+            started = time.perf_counter()
+            convert_images_recursive(tmp, "jpg", lambda msg: None, lambda done, total: None,
+                                     workers=workers, incremental=False)
+            elapsed = time.perf_counter() - started
+            base = base or elapsed
+            log_callback(
+                f"⏱ процессов {workers}: {images} фото за {elapsed:.2f} сек "
+                f"({images / elapsed:.1f} фото/сек, ускорение x{base / elapsed:.1f})"
+            )
+
+
+# --- Превью нескольких размеров ---
+RENDITION_SIZES = ((1200, 1200), (600, 600), (200, 200))
+RENDITION_QUALITY = 90
+
+
+def _rendition_folder(size):
+    return f"{size[0]}x{size[1]}"
+
+
+def _mark_rendition_folder(folder, files):
+    """Кладет в папку превью RENDITION_MARKER (если его нет) и сообщает индексу."""
+    marker = os.path.join(folder, RENDITION_MARKER)
+    if not os.path.exists(marker):
+        with open(marker, "w", encoding="utf-8"):
+            pass
+    files.add(marker)
+
+
+def parse_sizes(text):
+    """"1200x1200, 600x600" → [(1200, 1200), (600, 600)]."""
+    sizes = []
+    for part in text.replace(";", ",").split(","):
+        # "х" — русская буква, ее часто набирают вместо латинской
+        part = part.strip().lower().replace("х", "x").replace("*", "x")
+        if not part:
+            continue
+        width, _, height = part.partition("x")
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+def _rendition_paths(full_path, sizes, target_format):
+    folder, file = os.path.split(full_path)
+    name = os.path.splitext(file)[0]
+    extension = _target_extensions(target_format)[0]
+    return [os.path.join(folder, _rendition_folder(size), name + extension) for size in sizes]
+
+
+def _render_one(full_path, sizes, target_format, quality):
+    """Все размеры одного фото из одного декодирования; возвращает (файлы, секунды)."""
+    started = time.perf_counter()
+    with Image.open(full_path) as img:
+        # JPEG сразу декодируется в 1/2, 1/4 или 1/8 размера, если этого хватает
+        # самому большому превью, — в разы меньше работы на больших фото
+        img.draft("RGB", (max(w for w, h in sizes), max(h for w, h in sizes)))
+        rendition = img.convert("RGB")
+
+    pil_format = _pil_format(target_format)
+    outputs = dict(zip(sizes, _rendition_paths(full_path, sizes, target_format)))
+    # от большего к меньшему: каждый размер уменьшается из предыдущего
+    for size in sorted(sizes, key=lambda wh: wh[0] * wh[1], reverse=True):
+        rendition = rendition.copy()
+        rendition.thumbnail(size, Image.LANCZOS)
+        new_file = outputs[size]
+        os.makedirs(os.path.dirname(new_file), exist_ok=True)
+        rendition.save(new_file, pil_format, quality=quality)
+    return list(outputs.values()), time.perf_counter() - started
+
+
+def _render_chunk(paths, sizes, target_format, quality):
+    results = []
+    for full_path in paths:
+        try:
+            outputs, seconds = _render_one(full_path, sizes, target_format, quality)
+            results.append((full_path, outputs, None, seconds))
+        except Exception as e:
+            results.append((full_path, None, str(e), 0.0))
+    return results
+
+
+def _renditions_fresh(path, outputs, files):
+    renditions = [files.get(output) for output in outputs]
+    if any(rendition is None for rendition in renditions):
+        return False
+    entry = files.get(path)
+    return entry is not None and all(rendition.mtime_ns >= entry.mtime_ns for rendition in renditions)
+
+
+def generate_renditions(base_folder, sizes, log_callback, progress_callback, target_format="jpg",
+                        workers=None, chunk_size=CONVERT_CHUNK_SIZE, incremental=True,
+                        quality=RENDITION_QUALITY):
+    """Делает для каждого фото в папке превью всех размеров sizes.
+
+    Превью кладутся в подпапки рядом с фото ("1200x1200/имя.jpg"), помеченные
+    RENDITION_MARKER; помеченные подпапки не обходятся. Фото декодируется один раз, фото обрабатываются
+    параллельно в пуле процессов. incremental: пропускать фото, у которых все
+    превью уже есть и новее исходника.
+    """
+    if not os.path.isdir(base_folder):
+        log_callback(f"❌ Папка не найдена: {base_folder}")
+        return
+    if _pil_format(target_format) is None:
+        log_callback(f"❌ Неподдерживаемый формат: {target_format}")
+        return
+    sizes = [tuple(size) for size in sizes if size[0] > 0 and size[1] > 0]
+    if not sizes:
+        log_callback("❌ Не указаны размеры превью")
+        return
+
+    files = folder_index(base_folder)
+    images = []
+    skipped = 0
+    marked = set()
+
+    def mark(outputs):
+        for folder in {os.path.dirname(path) for path in outputs} - marked:
+            try:
+                _mark_rendition_folder(folder, files)
+            except OSError as e:
+                log_callback(f"⚠️ Папка превью не помечена {folder}: {e}")
+            marked.add(folder)
+
+    for path in files.paths(PHOTO_EXTENSIONS, skip_renditions=True):
+        outputs = _rendition_paths(path, sizes, target_format)
+        if incremental and _renditions_fresh(path, outputs, files):
+            mark(outputs)
+            skipped += 1
+            continue
+        images.append(path)
+
+    if skipped:
+        log_callback(f"⏭ Превью уже есть, пропущено: {skipped}")
+
+    total = len(images)
+    done = 0
+    rendered = 0
+    cpu_seconds = 0.0
+    slowest = (0.0, None)
+    started = time.perf_counter()
+
+    def report(results):
+        nonlocal done, rendered, cpu_seconds, slowest
+        for full_path, outputs, error, seconds in results:
+            if error is None:
+                log_callback(f"✅ {full_path} → {len(outputs)} разм., {seconds * 1000:.0f} мс")
+                for path in outputs:
+                    files.add(path)
+                mark(outputs)
+                rendered += 1
+                cpu_seconds += seconds
+                slowest = max(slowest, (seconds, full_path))
+            else:
+                log_callback(f"⚠️ {full_path} нельзя обработать: {error}")
+            done += 1
+        progress_callback(done, total)
+
+    _map_in_processes(_render_chunk, images, (sizes, target_format, quality), report, workers, chunk_size)
+
+    elapsed = time.perf_counter() - started
+    log_callback(f"🎉 Превью готовы: {rendered} фото, {rendered * len(sizes)} файлов за {elapsed:.1f} сек")
+    if rendered:
+        log_callback(
+            f"⏱ На одно фото: в среднем {cpu_seconds / rendered * 1000:.0f} мс, "
+            f"дольше всего {slowest[0] * 1000:.0f} мс ({slowest[1]}); "
+            f"{rendered / elapsed:.1f} фото/сек"
+        )
+
+
 # --- Удаление файлов ---
+def _delete_candidates(files, target_format):
+    # превью принадлежат generate_renditions, их не трогаем
+    return files.paths((f".{target_format.lower().lstrip('.')}",), skip_renditions=True)
+
+
 def _delete_files_worker(folder_path, target_format, log_callback, progress_callback):
-    files_to_delete = []
-    for root, dirs, files in os.walk(folder_path):
-        for file in files:
-            if file.lower().endswith(f".{target_format.lower()}"):
-                files_to_delete.append(os.path.join(root, file))
+    files = folder_index(folder_path)
+    files_to_delete = _delete_candidates(files, target_format)
 
     total = len(files_to_delete)
     done = 0
@@ -177,6 +3255,7 @@ def _delete_files_worker(folder_path, target_format, log_callback, progress_call
     for file_path in files_to_delete:
         try:
             os.remove(file_path)
+            files.remove(file_path)
             log_callback(f"🗑️ Удалено: {file_path}")
         except Exception as e:
             log_callback(f"❌ Не удалось удалить {file_path}: {e}")
@@ -186,39 +3265,367 @@ def _delete_files_worker(folder_path, target_format, log_callback, progress_call
     log_callback(f"🎉 Удаление завершено. Всего удалено: {done} файлов.")
 
     # --- Группировка фотографий в одну папку ---
-def group_photos(folder_path, log_callback):
+# Перемещения идут пачками в нескольких потоках — на сетевых дисках это заметно быстрее
+GROUP_WORKERS = 8
+GROUP_BATCH = 256
+
+
+def _unique_name(file, taken, counters):
+    """Свободное имя в корневой папке: file или name_N.ext.
+
+    taken — уже занятые имена (os.path.normcase), counters — с какого N
+    продолжать для каждого имени, чтобы не перебирать номера заново.
+    """
+    key = os.path.normcase(file)
+    if key not in taken:
+        taken.add(key)
+        return file
+    name, ext = os.path.splitext(file)
+    counter = counters.get(key, 1)
+    while True:
+        candidate = f"{name}_{counter}{ext}"
+        counter += 1
+        if os.path.normcase(candidate) not in taken:
+            break
+    counters[key] = counter
+    taken.add(os.path.normcase(candidate))
+    return candidate
+
+
+def _move_file(old_path, new_path):
+    """os.rename, а между разными дисками — копия через временный файл и удаление исходника."""
+    try:
+        os.rename(old_path, new_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        tmp_path = new_path + ".part"
+        try:
+            shutil.copy2(old_path, tmp_path)
+            os.replace(tmp_path, new_path)
+        except BaseException:
+            _remove_quietly(tmp_path)
+            raise
+        os.remove(old_path)
+
+
+def _move_batch(moves):
+    results = []
+    for old_path, new_path in moves:
+        try:
+            _move_file(old_path, new_path)
+            results.append((old_path, new_path, None))
+        except OSError as e:
+            results.append((old_path, new_path, str(e)))
+    return results
+
+
+def _group_moves(files):
+    """[(путь, новый путь в корне)] для всех фото из подпапок индекса files, кроме папок превью."""
+    # занятость имен в корневой папке проверяется по множеству из индекса
+    taken = {os.path.normcase(name) for name in files.names(files.root)}
+    counters = {}
+    moves = []
+    for path in sorted(files.paths(PHOTO_EXTENSIONS, skip_renditions=True)):
+        root_dir, file = os.path.split(path)
+        if root_dir == files.root:
+            continue
+        moves.append((path, os.path.join(files.root, _unique_name(file, taken, counters))))
+    return moves
+
+
+def group_photos(folder_path, log_callback, progress_callback=None, workers=GROUP_WORKERS):
     if not os.path.isdir(folder_path):
         log_callback(f"❌ Папка не найдена: {folder_path}")
         return
 
+    files = folder_index(folder_path)
+    moves = _group_moves(files)
+
+    total = len(moves)
+    done = 0
     moved = 0
 
-    for root_dir, dirs, files in os.walk(folder_path):
-        if root_dir == folder_path:
-            continue
+    def report(results):
+        nonlocal done, moved
+        for old_path, new_path, error in results:
+            file, new_name = os.path.basename(old_path), os.path.basename(new_path)
+            if error is None:
+                moved += 1
+                files.move(old_path, new_path)
+                log_callback(f"📂 Перемещен: {file}" + (f" → {new_name}" if new_name != file else ""))
+            else:
+                log_callback(f"❌ Не удалось переместить {old_path}: {error}")
+            done += 1
+        if progress_callback is not None:
+            progress_callback(done, total)
 
-        for file in files:
-            if file.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+    batches = [moves[i:i + GROUP_BATCH] for i in range(0, total, GROUP_BATCH)]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for future in as_completed([executor.submit(_move_batch, batch) for batch in batches]):
+            report(future.result())
 
-                old_path = os.path.join(root_dir, file)
-                new_path = os.path.join(folder_path, file)
+    log_callback(f"🎉 Группировка завершена. Перемещено файлов: {moved}")
 
-                counter = 1
 
-                while os.path.exists(new_path):
-                    name, ext = os.path.splitext(file)
-                    new_path = os.path.join(
-                        folder_path,
-                        f"{name}_{counter}{ext}"
-                    )
-                    counter += 1
+# --- План операций над папкой ---
+FOLDER_OPERATIONS = {
+    "convert": convert_images_recursive,
+    "delete": _delete_files_worker,
+    "group": group_photos,
+}
 
-                os.rename(old_path, new_path)
 
-                moved += 1
-                log_callback(f"📂 Перемещен: {file}")
+@dataclass
+class FolderPlan:
+    """Что сделает конвертация, удаление или группировка; execute() выполняет операцию.
 
-    log_callback(f"🎉 Группировка завершена. Перемещено файлов: {moved}")
+    Папка уже в индексе (folder_index), поэтому выполнение не обходит ее заново.
+    """
+    operation: str
+    folder: str
+    options: dict
+    files: int = 0
+    bytes: int = 0
+    skipped: int = 0
+    renamed: int = 0
+
+    def log(self, log_callback):
+        size = f"{self.bytes / (1024 * 1024):.1f} МБ"
+        if self.operation == "convert":
+            log_callback(f"📋 Конвертация в {self.options['target_format']}: файлов {self.files} ({size})"
+                         + (f", без изменений {self.skipped}" if self.skipped else ""))
+        elif self.operation == "delete":
+            log_callback(f"📋 Удаление .{self.options['target_format']}: файлов {self.files} ({size})")
+        else:
+            log_callback(f"📋 Группировка: переместить {self.files} ({size})"
+                         + (f", переименовать из-за совпадений {self.renamed}" if self.renamed else ""))
+
+    def execute(self, log_callback, progress_callback=None):
+        FOLDER_OPERATIONS[self.operation](self.folder, log_callback=log_callback,
+                                          progress_callback=progress_callback or (lambda done, total: None),
+                                          **self.options)
+
+
+def plan_folder(folder, operation, log_callback, **options):
+    """План операции operation ("convert", "delete", "group") для папки без изменений на диске.
+
+    options — именованные параметры самой операции (target_format, incremental,
+    hash_index, workers); с ними же план выполняется через execute().
+    """
+    if not os.path.isdir(folder):
+        log_callback(f"❌ Папка не найдена: {folder}")
+        return None
+    target_format = options.get("target_format")
+    if operation == "convert" and _pil_format(target_format) is None:
+        log_callback(f"❌ Неподдерживаемый формат: {target_format}")
+        return None
+
+    plan = FolderPlan(operation, folder, options)
+    files = folder_index(folder)
+    if operation == "convert":
+        index = None
+        if (options.get("incremental", True) and options.get("hash_index")
+                and os.path.exists(os.path.join(folder, CONVERT_INDEX_NAME))):
+            try:
+                index = ConversionIndex(folder, target_format, read_only=True)
+            except sqlite3.Error as e:
+                log_callback(f"⚠️ Индекс конвертации недоступен, сравниваются даты: {e}")
+        try:
+            paths, plan.skipped = _convert_candidates(files, _target_extensions(target_format),
+                                                      options.get("incremental", True), index)
+        finally:
+            if index is not None:
+                index.close()
+    elif operation == "delete":
+        paths = _delete_candidates(files, target_format)
+    else:
+        moves = _group_moves(files)
+        paths = [path for path, new_path in moves]
+        plan.renamed = sum(os.path.basename(path) != os.path.basename(new_path) for path, new_path in moves)
+    plan.files = len(paths)
+    plan.bytes = sum(files.size(path) or 0 for path in paths)
+    plan.log(log_callback)
+    return plan
+
+
+# --- Командная строка ---
+def _cli_log(msg):
+    print(msg, flush=True)
+
+
+def _cli_progress(step=5):
+    """Прогресс для лога: строка на каждые step процентов, а не на каждое фото."""
+    last = -step
+
+    def progress(done, total):
+        nonlocal last
+        percent = int(done / total * 100) if total else 100
+        if percent != last and (percent - last >= step or done == total):
+            last = percent
+            print(f"⏳ {percent}% ({done}/{total})", file=sys.stderr, flush=True)
+
+    return progress
+
+
+def _excel_inputs(paths):
+    """Файлы и папки (берутся все .xlsx/.xlsm/.xls в них) → отсортированный список Excel-файлов."""
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            for file in os.listdir(path):
+                if file.lower().endswith((".xlsx", ".xlsm", ".xls")) and not file.startswith("~$"):
+                    files.add(os.path.join(path, file))
+        else:
+            files.update(glob.glob(path) or [path])
+    return sorted(files)
+
+
+def _parse_shard(text):
+    """"2/4" → (1, 4): второй из четырех."""
+    index, _, count = text.partition("/")
+    index, count = int(index), int(count)
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("шард задается как K/N, 1 <= K <= N")
+    return index - 1, count
+
+
+def _columns(text):
+    return [int(c.strip()) - 1 for c in text.split(",") if c.strip()]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="import_photos",
+        description="Загрузка фото по ссылкам из Excel, конвертация, превью, удаление и группировка без окна."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("download", help="скачать фото по ссылкам из Excel")
+    p.add_argument("excel", nargs="+", help="Excel-файлы, маски или папки с ними")
+    p.add_argument("--article-col", type=int, default=1, help="колонка с артикулом (с 1)")
+    p.add_argument("--photo-cols", type=_columns, default=[1], help="колонки со ссылками, через запятую (с 1)")
+    p.add_argument("--suffix", default="", help="суффикс после артикула")
+    p.add_argument("--start-index", type=int, default=1)
+    p.add_argument("--before", default="", help="текст перед номером фото")
+    p.add_argument("--after", default="", help="текст после номера фото")
+    p.add_argument("--delay", type=float, default=3, help="пауза между запросами к одному сайту, сек")
+    p.add_argument("--random-delay", action="store_true")
+    p.add_argument("--referer", default="")
+    p.add_argument("--workers", type=int, default=None, help="потоков (или запросов в полете для async)")
+    p.add_argument("--per-host", type=int, default=PER_HOST_LIMIT, help="соединений к одному сайту")
+    p.add_argument("--per-host-streams", type=int, default=ASYNC_STREAMS_PER_HOST,
+                   help="запросов к одному сайту с HTTP/2 (только async)")
+    p.add_argument("--backend", choices=("threads", "async"), default="threads")
+    p.add_argument("--host-rate", type=float, default=None, help="запросов в секунду на сайт")
+    p.add_argument("--max-size", type=float, default=MAX_PHOTO_BYTES / (1024 * 1024), help="МБ")
+    p.add_argument("--convert-to", choices=("jpg", "png", "webp"), default=None)
+    p.add_argument("--attempts", type=int, default=RETRY_ATTEMPTS, help="попыток на фото")
+    p.add_argument("--no-resume", action="store_true")
+    p.add_argument("--no-revalidate", action="store_true")
+    p.add_argument("--no-dedupe", action="store_true")
+    p.add_argument("--skip-existing", action="store_true", help="не скачивать фото, файл которых уже есть в папке")
+    p.add_argument("--verify-existing", choices=EXISTING_CHECKS, default=None,
+                   help="проверять найденные файлы: size — по размеру, decode — открываются ли")
+    p.add_argument("--validate", choices=("off",) + PAYLOAD_CHECKS, default="magic",
+                   help="проверять скачанное: magic — сигнатура и Content-Type, verify — еще и декодирование")
+    p.add_argument("--no-run-log", action="store_true", help=f"не писать журнал в {RUN_LOG_FOLDER}")
+    p.add_argument("--shard", type=_parse_shard, default=None,
+                   help="K/N: обработать только K-ю из N частей списка файлов (для нескольких машин)")
+    p.add_argument("--dry-run", action="store_true", help="только показать план: ссылки, сайты, повторы, время")
+
+    p = commands.add_parser("convert", help="сконвертировать фото в папке")
+    p.add_argument("folder")
+    p.add_argument("format", choices=("jpg", "png", "webp"))
+    p.add_argument("--workers", type=int, default=None, help="процессов")
+    p.add_argument("--full", action="store_true", help="конвертировать все файлы, а не только новые")
+    p.add_argument("--hash-index", action="store_true", help="сверять содержимое по индексу в папке")
+    p.add_argument("--dry-run", action="store_true", help="только показать, что будет сконвертировано")
+
+    p = commands.add_parser("renditions", help="сделать превью нескольких размеров")
+    p.add_argument("folder")
+    p.add_argument("--sizes", type=parse_sizes, default=list(RENDITION_SIZES), help="например 1200x1200,600x600")
+    p.add_argument("--format", choices=("jpg", "png", "webp"), default="jpg")
+    p.add_argument("--workers", type=int, default=None, help="процессов")
+    p.add_argument("--full", action="store_true", help="пересоздать все превью")
+
+    p = commands.add_parser("delete", help="удалить все файлы формата в папке")
+    p.add_argument("folder")
+    p.add_argument("format")
+    p.add_argument("--yes", action="store_true", help="подтверждение: без него ничего не удаляется")
+    p.add_argument("--dry-run", action="store_true", help="только показать, что будет удалено")
+
+    p = commands.add_parser("group", help="собрать фото из подпапок в одну папку")
+    p.add_argument("folder")
+    p.add_argument("--dry-run", action="store_true", help="только показать, что будет перемещено")
+
+    commands.add_parser("benchmark", help="сравнить бэкенды загрузки на локальном сервере")
+    commands.add_parser("benchmark-convert", help="скорость конвертации по числу процессов")
+    return parser
+
+
+def main(argv=None):
+    """Точка входа командной строки; возвращает код выхода."""
+    args = build_parser().parse_args(argv)
+    progress = _cli_progress()
+
+    if args.command == "download":
+        excel_paths = _excel_inputs(args.excel)
+        if args.shard is not None:
+            index, count = args.shard
+            excel_paths = excel_paths[index::count]
+        missing = [path for path in excel_paths if not os.path.isfile(path)]
+        if missing:
+            _cli_log(f"❌ Файлы не найдены: {', '.join(missing)}")
+            return 2
+        if not excel_paths:
+            _cli_log("⚠️ Нет Excel-файлов для обработки")
+            return 0
+        max_workers = args.workers or (ASYNC_MAX_IN_FLIGHT if args.backend == "async" else MAX_WORKERS)
+        options = dict(article_suffix=args.suffix, start_index=args.start_index,
+                       static_before=args.before, static_after=args.after,
+                       delay_seconds=args.delay, random_delay=args.random_delay, referer=args.referer,
+                       max_workers=max_workers, per_host_limit=args.per_host, backend=args.backend,
+                       per_host_streams=args.per_host_streams,
+                       host_rate=args.host_rate, max_bytes=int(args.max_size * 1024 * 1024),
+                       resume=not args.no_resume, revalidate=not args.no_revalidate,
+                       dedupe=not args.no_dedupe, convert_to=args.convert_to,
+                       retry_policy=RetryPolicy(max_attempts=max(1, args.attempts)),
+                       run_log=not args.no_run_log, skip_existing=args.skip_existing,
+                       verify_existing=args.verify_existing,
+                       validate=args.validate if args.validate != "off" else None)
+        if args.dry_run:
+            plan_download(excel_paths, args.article_col - 1, args.photo_cols, _cli_log, **options)
+            return 0
+        download_photos_batch(excel_paths, args.article_col - 1, args.photo_cols, progress, _cli_log, **options)
+    elif args.command == "convert":
+        if args.dry_run:
+            plan_folder(args.folder, "convert", _cli_log, target_format=args.format, workers=args.workers,
+                        incremental=not args.full, hash_index=args.hash_index)
+            return 0
+        convert_images_recursive(args.folder, args.format, _cli_log, progress, workers=args.workers,
+                                 incremental=not args.full, hash_index=args.hash_index)
+    elif args.command == "renditions":
+        generate_renditions(args.folder, args.sizes, _cli_log, progress, args.format,
+                            workers=args.workers, incremental=not args.full)
+    elif args.command == "delete":
+        if args.dry_run:
+            plan_folder(args.folder, "delete", _cli_log, target_format=args.format)
+            return 0
+        if not args.yes:
+            _cli_log(f"❌ Удаление всех .{args.format} в {args.folder} нужно подтвердить флагом --yes")
+            return 2
+        _delete_files_worker(args.folder, args.format, _cli_log, progress)
+    elif args.command == "group":
+        if args.dry_run:
+            plan_folder(args.folder, "group", _cli_log)
+            return 0
+        group_photos(args.folder, _cli_log, progress)
+    elif args.command == "benchmark":
+        benchmark_backends(log_callback=_cli_log)
+    elif args.command == "benchmark-convert":
+        benchmark_conversion(log_callback=_cli_log)
+    return 0
 
 
 # --- GUI ---
@@ -266,18 +3673,19 @@ def add_file_entry():
     file_entries.append(entry)
 
 
-def start_download():
+def _download_arguments():
+    """(excel_paths, article_col, photo_cols, параметры download_photos_batch) из окна или None."""
     excel_paths = [e.get().strip() for e in file_entries if e.get().strip()]
     if not excel_paths:
         messagebox.showerror("Ошибка", "Добавьте хотя бы один Excel файл.")
-        return
+        return None
 
     try:
         article_col = int(entry_article_col.get()) - 1
         photo_cols = [int(c.strip()) - 1 for c in entry_photo_cols.get().split(",")]
     except:
         messagebox.showerror("Ошибка", "Введите корректные номера колонок.")
-        return
+        return None
 
     article_suffix = entry_article_suffix.get().strip()
     try:
@@ -288,18 +3696,88 @@ def start_download():
     static_before = entry_static_before.get().strip()
     static_after = entry_static_after.get().strip()
 
+    try:
+        max_workers = int(entry_max_workers.get())
+        per_host_limit = int(entry_per_host.get())
+    except:
+        max_workers, per_host_limit = MAX_WORKERS, PER_HOST_LIMIT
+
+    backend = "async" if combo_backend.get() == "asyncio" else "threads"
+
+    try:
+        delay_seconds = float(entry_delay.get().replace(",", "."))
+    except:
+        delay_seconds = 3
+    try:
+        host_rate = float(entry_host_rate.get().replace(",", ".")) or None
+    except:
+        host_rate = None
+    random_delay = var_random_delay.get()
+    resume = var_resume.get()
+    revalidate = var_revalidate.get()
+    dedupe = var_dedupe.get()
+    convert_to = combo_save_format.get() if combo_save_format.get() != "как есть" else None
+    run_log = var_run_log.get()
+    skip_existing = var_skip_existing.get()
+    verify_existing = GUI_EXISTING_CHECKS.get(combo_verify_existing.get())
+    validate = GUI_PAYLOAD_CHECKS.get(combo_validate.get(), "magic")
+
+    try:
+        max_bytes = int(float(entry_max_size.get().replace(",", ".")) * 1024 * 1024)
+    except:
+        max_bytes = MAX_PHOTO_BYTES
+
+    try:
+        retry_policy = RetryPolicy(max_attempts=max(1, int(entry_attempts.get())))
+    except:
+        retry_policy = RetryPolicy()
+
+    options = dict(article_suffix=article_suffix, start_index=start_index,
+                   static_before=static_before, static_after=static_after,
+                   delay_seconds=delay_seconds, random_delay=random_delay,
+                   max_workers=max_workers, per_host_limit=per_host_limit,
+                   backend=backend, host_rate=host_rate, max_bytes=max_bytes,
+                   resume=resume, revalidate=revalidate, dedupe=dedupe, convert_to=convert_to,
+                   retry_policy=retry_policy, run_log=run_log,
+                   skip_existing=skip_existing, verify_existing=verify_existing, validate=validate)
+    return excel_paths, article_col, photo_cols, options
+
+
+def start_download():
+    global gui_metrics
+    arguments = _download_arguments()
+    if arguments is None:
+        return
+    excel_paths, article_col, photo_cols, options = arguments
+
     text_log.delete(1.0, tk.END)
+    gui_metrics = StageMetrics()
+    options["metrics"] = gui_metrics
 
     def run():
-        total_files = len(excel_paths)
-        for idx, path in enumerate(excel_paths, start=1):
-            log_callback(f"📂 Обработка файла ({idx}/{total_files}): {path}")
-            download_photos(path, article_col, photo_cols, progress_callback, log_callback,
-                            article_suffix, start_index, static_before, static_after)
+        download_photos_batch(excel_paths, article_col, photo_cols, progress_callback, log_callback, **options)
 
     threading.Thread(target=run, daemon=True).start()
 
 
+def show_download_plan():
+    arguments = _download_arguments()
+    if arguments is None:
+        return
+    excel_paths, article_col, photo_cols, options = arguments
+    text_log.delete(1.0, tk.END)
+    threading.Thread(
+        target=lambda: plan_download(excel_paths, article_col, photo_cols, log_callback, **options),
+        daemon=True
+    ).start()
+
+
+def on_backend_selected(event=None):
+    # у asyncio "потоки" — это запросы в полете, их разумно держать намного больше
+    entry_max_workers.delete(0, tk.END)
+    entry_max_workers.insert(0, str(ASYNC_MAX_IN_FLIGHT if combo_backend.get() == "asyncio" else MAX_WORKERS))
+
+
 def delete_files_of_format():
     folder_path = entry_convert_folder.get().strip()
     target_format = combo_format.get()
@@ -323,11 +3801,60 @@ def start_conversion():
     if not folder_path or not target_format:
         messagebox.showerror("Ошибка", "Укажите папку и формат для конвертации.")
         return
+    try:
+        workers = int(entry_convert_workers.get())
+    except:
+        workers = None
+    incremental = var_convert_incremental.get()
+    hash_index = var_convert_hash_index.get()
+    threading.Thread(
+        target=lambda: convert_images_recursive(folder_path, target_format, log_callback, progress_callback,
+                                                workers=workers, incremental=incremental, hash_index=hash_index),
+        daemon=True
+    ).start()
+
+def start_renditions():
+    folder_path = entry_convert_folder.get().strip()
+    target_format = combo_format.get()
+    if not folder_path or not target_format:
+        messagebox.showerror("Ошибка", "Укажите папку и формат для превью.")
+        return
+    try:
+        sizes = parse_sizes(entry_rendition_sizes.get())
+    except ValueError:
+        messagebox.showerror("Ошибка", "Размеры указываются так: 1200x1200, 600x600")
+        return
+    try:
+        workers = int(entry_convert_workers.get())
+    except:
+        workers = None
+    incremental = var_convert_incremental.get()
     threading.Thread(
-        target=lambda: convert_images_recursive(folder_path, target_format, log_callback, progress_callback),
+        target=lambda: generate_renditions(folder_path, sizes, log_callback, progress_callback, target_format,
+                                           workers=workers, incremental=incremental),
         daemon=True
     ).start()
 
+def show_folder_plan():
+    folder_path = entry_convert_folder.get().strip()
+    target_format = combo_format.get()
+    if not folder_path or not target_format:
+        messagebox.showerror("Ошибка", "Укажите папку и формат.")
+        return
+    incremental = var_convert_incremental.get()
+    hash_index = var_convert_hash_index.get()
+
+    def run():
+        # один обход папки на все три плана — дальше индекс берется из памяти
+        if plan_folder(folder_path, "convert", log_callback, target_format=target_format,
+                       incremental=incremental, hash_index=hash_index) is None:
+            return
+        plan_folder(folder_path, "delete", log_callback, target_format=target_format)
+        plan_folder(folder_path, "group", log_callback)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
 def start_grouping():
     folder_path = entry_convert_folder.get().strip()
 
@@ -336,153 +3863,334 @@ def start_grouping():
         return
 
     threading.Thread(
-        target=lambda: group_photos(folder_path, log_callback),
+        target=lambda: group_photos(folder_path, log_callback, progress_callback),
         daemon=True
     ).start()    
 
 
+# подписи проверки уже скачанных файлов в окне → verify_existing
+GUI_EXISTING_CHECKS = {"нет": None, "по размеру": "size", "открывается": "decode"}
+# подписи проверки скачанного → validate
+GUI_PAYLOAD_CHECKS = {"сигнатура и тип": "magic", "декодирование": "verify", "нет": None}
+
+
+# Колбэки зовутся из рабочих потоков, а Tk можно трогать только из главного:
+# потоки складывают сообщения в очередь, окно забирает их пачкой по таймеру
+GUI_POLL_MS = 100
+GUI_LOG_LINES = 5000
+gui_log = queue.SimpleQueue()
+gui_progress = None
+shown_progress = None
+# метрики текущей загрузки — строка под прогрессом обновляется раз в секунду
+gui_metrics = None
+GUI_METRICS_EVERY = 10
+gui_ticks = 0
+
+
 def log_callback(msg):
-    text_log.insert(tk.END, msg + "\n")
-    text_log.see(tk.END)
+    gui_log.put(msg)
 
 
 def progress_callback(done, total):
-    percent = int(done / total * 100) if total else 0
-    progress_bar["value"] = percent
-    lbl_progress.config(text=f"{percent}% ({done}/{total})")
-    root.update_idletasks()
+    # хранится только последнее значение — промежуточные окну не нужны
+    global gui_progress
+    gui_progress = (done, total)
+
+
+def drain_gui_events():
+    """Переносит накопленные сообщения и прогресс в окно и планирует следующий запуск."""
+    global shown_progress, gui_ticks
+    lines = deque(maxlen=GUI_LOG_LINES)
+    try:
+        while True:
+            lines.append(gui_log.get_nowait())
+    except queue.Empty:
+        pass
+    if lines:
+        text_log.insert(tk.END, "\n".join(lines) + "\n")
+        # в окне только последние GUI_LOG_LINES строк
+        extra = int(text_log.index("end-1c").split(".")[0]) - 1 - GUI_LOG_LINES
+        if extra > 0:
+            text_log.delete("1.0", f"{extra + 1}.0")
+        text_log.see(tk.END)
+
+    progress = gui_progress
+    if progress is not None and progress != shown_progress:
+        shown_progress = progress
+        done, total = progress
+        percent = int(done / total * 100) if total else 0
+        progress_bar["value"] = percent
+        lbl_progress.config(text=f"{percent}% ({done}/{total})")
+
+    gui_ticks += 1
+    if gui_metrics is not None and gui_ticks % GUI_METRICS_EVERY == 0:
+        lbl_metrics.config(text=gui_metrics.summary_line())
+
+    root.after(GUI_POLL_MS, drain_gui_events)
 
 
 def open_link(url):
     webbrowser.open(url)
 
 
-# --- GUI Window ---
-root = tk.Tk()
-root.title("Photo Downloader & Converter v6.0")
-root.geometry("950x750")
-root.minsize(850, 650)
-
-# Инструкция
-lbl_instr = tk.Label(root, text=(
-    "Инструкция:\n"
-    "1. Добавьте Excel-файлы с данными.\n"
-    "2. Укажите колонку с артикулами и колонки со ссылками (нумерация с 1).\n"
-    "3. Дополнительно настройте суффиксы и статичные значения для имен.\n"
-    "4. Нажмите 'Начать скачивание' для сохранения фото.\n"
-    "5. В секции 'Конвертор' укажите папку с фото и формат для конвертации/удаления."
-), justify="left", wraplength=900, fg="blue")
-lbl_instr.pack(pady=10)
-
-# Файлы Excel
-file_frame = tk.Frame(root)
-file_frame.pack(pady=10, fill="x")
-file_frame.columnconfigure(0, weight=1)
-file_entries = []
-add_file_entry()
-btn_add = tk.Button(root, text="+ Добавить файл", command=add_file_entry)
-btn_add.pack(pady=5)
-
-# Настройки колонок
-frame_cols = tk.LabelFrame(root, text="Настройки колонок и имен файлов")
-frame_cols.pack(pady=5, fill="x", padx=5)
-frame_cols.columnconfigure(1, weight=1)
-frame_cols.columnconfigure(3, weight=1)
-
-tk.Label(frame_cols, text="Колонка с артикулами:").grid(row=0, column=0, sticky="e")
-entry_article_col = tk.Entry(frame_cols, width=5)
-entry_article_col.insert(0, "1")
-entry_article_col.grid(row=0, column=1, padx=5, sticky="ew")
-
-tk.Label(frame_cols, text="Колонки со ссылками:").grid(row=0, column=2, sticky="e")
-entry_photo_cols = tk.Entry(frame_cols, width=15)
-entry_photo_cols.insert(0, "2,3,4,5,6")
-entry_photo_cols.grid(row=0, column=3, padx=5, sticky="ew")
-
-tk.Label(frame_cols, text="Суффикс к артикулу:").grid(row=1, column=0, sticky="e")
-entry_article_suffix = tk.Entry(frame_cols, width=10)
-entry_article_suffix.insert(0, "")
-entry_article_suffix.grid(row=1, column=1, padx=5, sticky="ew")
-
-tk.Label(frame_cols, text="Начальное число фото:").grid(row=1, column=2, sticky="e")
-entry_start_index = tk.Entry(frame_cols, width=5)
-entry_start_index.insert(0, "1")
-entry_start_index.grid(row=1, column=3, padx=5, sticky="ew")
-
-tk.Label(frame_cols, text="Статичный текст ДО (_):").grid(row=2, column=0, sticky="e")
-entry_static_before = tk.Entry(frame_cols, width=10)
-entry_static_before.insert(0, "")
-entry_static_before.grid(row=2, column=1, padx=5, sticky="ew")
-
-tk.Label(frame_cols, text="Статичный текст ПОСЛЕ (_):").grid(row=2, column=2, sticky="e")
-entry_static_after = tk.Entry(frame_cols, width=10)
-entry_static_after.insert(0, "")
-entry_static_after.grid(row=2, column=3, padx=5, sticky="ew")
-
-# Кнопка скачивания
-btn_start = tk.Button(root, text="Начать скачивание", command=start_download, bg="green", fg="white")
-btn_start.pack(pady=10)
-
-# Конвертор изображений
-frame_convert = tk.LabelFrame(root, text="Конвертор формата фотографий")
-frame_convert.pack(pady=10, fill="x", padx=5)
-frame_convert.columnconfigure(1, weight=1)
-
-tk.Label(frame_convert, text="Папка с изображениями:").grid(row=0, column=0, sticky="e")
-entry_convert_folder = tk.Entry(frame_convert, width=70)
-entry_convert_folder.grid(row=0, column=1, padx=5, sticky="ew")
-btn_browse_folder = tk.Button(frame_convert, text="Обзор", command=lambda: browse_folder(entry_convert_folder))
-btn_browse_folder.grid(row=0, column=2, padx=2)
-
-tk.Label(frame_convert, text="Формат:").grid(row=1, column=0, sticky="e")
-combo_format = ttk.Combobox(frame_convert, values=["png", "jpg", "webp"], width=10)
-combo_format.current(0)
-combo_format.grid(row=1, column=1, sticky="w", padx=5)
-
-btn_convert = tk.Button(frame_convert, text="Конвертировать", command=start_conversion, bg="orange", fg="white")
-btn_convert.grid(row=2, column=1, pady=5, sticky="w")
-
-btn_delete = tk.Button(frame_convert, text="Удалить все файлы формата", command=delete_files_of_format, bg="red", fg="white")
-btn_delete.grid(row=2, column=2, padx=5, sticky="w")
-
-btn_group = tk.Button(
-    frame_convert,
-    text="Сгруппировать фото",
-    command=start_grouping,
-    bg="purple",
-    fg="white"
-)
-
-btn_group.grid(row=3, column=1, pady=5, sticky="w")
-
-# Прогресс
-progress_bar = ttk.Progressbar(
-    root,
-    length=700,
-    maximum=100
-)
-progress_bar.pack(pady=5, fill="x", padx=5)
-lbl_progress = tk.Label(root, text="0%")
-lbl_progress.pack()
-
-# Лог
-text_log = scrolledtext.ScrolledText(root, width=110, height=20)
-text_log.pack(pady=10, fill="both", expand=True)
-
-# Подпись внизу
-frame_footer = tk.Frame(root)
-frame_footer.pack(fill="x", pady=5, padx=10)
-frame_footer.columnconfigure(0, weight=1)
-frame_footer.columnconfigure(1, weight=1)
-
-lbl_left = tk.Label(frame_footer, text="Программа от Three_Per_Cento", fg="blue", cursor="hand2")
-lbl_left.grid(row=0, column=0, sticky="w")
-lbl_left.bind("<Button-1>", lambda e: open_link("https://github.com/ThreePerCento"))
-
-lbl_right = tk.Label(frame_footer, text="GitHub program", fg="blue", cursor="hand2")
-lbl_right.grid(row=0, column=1, sticky="e")
-lbl_right.bind("<Button-1>", lambda e: open_link("https://github.com/ThreePerCento/Photo_downloader_from_links_to_Excel/releases"))
-
-root.mainloop()
+if __name__ == "__main__":
+    # нужно для процессов конвертации в собранном exe
+    multiprocessing.freeze_support()
+
+    # Запуск без окна: python "import_photos (v6).py" download|convert|renditions|delete|group ...
+    if len(sys.argv) > 1:
+        sys.exit(main())
+    if tk is None:
+        sys.exit("tkinter недоступен: запустите с командой, например download --help")
+
+    # --- GUI Window ---
+    root = tk.Tk()
+    root.title("Photo Downloader & Converter v6.0")
+    root.geometry("950x750")
+    root.minsize(850, 650)
+
+    # Инструкция
+    lbl_instr = tk.Label(root, text=(
+        "Инструкция:\n"
+        "1. Добавьте Excel-файлы с данными.\n"
+        "2. Укажите колонку с артикулами и колонки со ссылками (нумерация с 1).\n"
+        "3. Дополнительно настройте суффиксы и статичные значения для имен.\n"
+        "4. Нажмите 'Начать скачивание' для сохранения фото.\n"
+        "5. В секции 'Конвертор' укажите папку с фото и формат для конвертации/удаления."
+    ), justify="left", wraplength=900, fg="blue")
+    lbl_instr.pack(pady=10)
+
+    # Файлы Excel
+    file_frame = tk.Frame(root)
+    file_frame.pack(pady=10, fill="x")
+    file_frame.columnconfigure(0, weight=1)
+    file_entries = []
+    add_file_entry()
+    btn_add = tk.Button(root, text="+ Добавить файл", command=add_file_entry)
+    btn_add.pack(pady=5)
+
+    # Настройки колонок
+    frame_cols = tk.LabelFrame(root, text="Настройки колонок и имен файлов")
+    frame_cols.pack(pady=5, fill="x", padx=5)
+    frame_cols.columnconfigure(1, weight=1)
+    frame_cols.columnconfigure(3, weight=1)
+
+    tk.Label(frame_cols, text="Колонка с артикулами:").grid(row=0, column=0, sticky="e")
+    entry_article_col = tk.Entry(frame_cols, width=5)
+    entry_article_col.insert(0, "1")
+    entry_article_col.grid(row=0, column=1, padx=5, sticky="ew")
+
+    tk.Label(frame_cols, text="Колонки со ссылками:").grid(row=0, column=2, sticky="e")
+    entry_photo_cols = tk.Entry(frame_cols, width=15)
+    entry_photo_cols.insert(0, "2,3,4,5,6")
+    entry_photo_cols.grid(row=0, column=3, padx=5, sticky="ew")
+
+    tk.Label(frame_cols, text="Суффикс к артикулу:").grid(row=1, column=0, sticky="e")
+    entry_article_suffix = tk.Entry(frame_cols, width=10)
+    entry_article_suffix.insert(0, "")
+    entry_article_suffix.grid(row=1, column=1, padx=5, sticky="ew")
+
+    tk.Label(frame_cols, text="Начальное число фото:").grid(row=1, column=2, sticky="e")
+    entry_start_index = tk.Entry(frame_cols, width=5)
+    entry_start_index.insert(0, "1")
+    entry_start_index.grid(row=1, column=3, padx=5, sticky="ew")
+
+    tk.Label(frame_cols, text="Статичный текст ДО (_):").grid(row=2, column=0, sticky="e")
+    entry_static_before = tk.Entry(frame_cols, width=10)
+    entry_static_before.insert(0, "")
+    entry_static_before.grid(row=2, column=1, padx=5, sticky="ew")
+
+    tk.Label(frame_cols, text="Статичный текст ПОСЛЕ (_):").grid(row=2, column=2, sticky="e")
+    entry_static_after = tk.Entry(frame_cols, width=10)
+    entry_static_after.insert(0, "")
+    entry_static_after.grid(row=2, column=3, padx=5, sticky="ew")
+
+    tk.Label(frame_cols, text="Потоков загрузки:").grid(row=3, column=0, sticky="e")
+    entry_max_workers = tk.Entry(frame_cols, width=5)
+    entry_max_workers.insert(0, str(MAX_WORKERS))
+    entry_max_workers.grid(row=3, column=1, padx=5, sticky="ew")
+
+    tk.Label(frame_cols, text="Соединений на один сайт:").grid(row=3, column=2, sticky="e")
+    entry_per_host = tk.Entry(frame_cols, width=5)
+    entry_per_host.insert(0, str(PER_HOST_LIMIT))
+    entry_per_host.grid(row=3, column=3, padx=5, sticky="ew")
+
+    tk.Label(frame_cols, text="Режим загрузки:").grid(row=4, column=0, sticky="e")
+    combo_backend = ttk.Combobox(frame_cols, values=["потоки", "asyncio"], width=10, state="readonly")
+    combo_backend.current(0)
+    combo_backend.grid(row=4, column=1, padx=5, sticky="w")
+    combo_backend.bind("<<ComboboxSelected>>", on_backend_selected)
+
+    tk.Label(frame_cols, text="Запросов/сек на сайт (0 — без лимита):").grid(row=4, column=2, sticky="e")
+    entry_host_rate = tk.Entry(frame_cols, width=5)
+    entry_host_rate.insert(0, "0")
+    entry_host_rate.grid(row=4, column=3, padx=5, sticky="ew")
+
+    tk.Label(frame_cols, text="Пауза при блокировке 403/429, сек:").grid(row=5, column=0, sticky="e")
+    entry_delay = tk.Entry(frame_cols, width=5)
+    entry_delay.insert(0, "3")
+    entry_delay.grid(row=5, column=1, padx=5, sticky="ew")
+
+    var_random_delay = tk.BooleanVar(value=True)
+    tk.Checkbutton(frame_cols, text="Случайная пауза", variable=var_random_delay).grid(row=5, column=2, columnspan=2, sticky="w")
+
+    tk.Label(frame_cols, text="Макс. размер фото, МБ:").grid(row=6, column=0, sticky="e")
+    entry_max_size = tk.Entry(frame_cols, width=5)
+    entry_max_size.insert(0, str(MAX_PHOTO_BYTES // (1024 * 1024)))
+    entry_max_size.grid(row=6, column=1, padx=5, sticky="ew")
+
+    var_resume = tk.BooleanVar(value=True)
+    tk.Checkbutton(frame_cols, text="Продолжить прерванную загрузку", variable=var_resume).grid(row=6, column=2, columnspan=2, sticky="w")
+
+    var_revalidate = tk.BooleanVar(value=True)
+    tk.Checkbutton(
+        frame_cols,
+        text="Не скачивать заново фото, которые не изменились на сервере (ETag/Last-Modified)",
+        variable=var_revalidate
+    ).grid(row=7, column=0, columnspan=4, sticky="w")
+
+    var_dedupe = tk.BooleanVar(value=True)
+    tk.Checkbutton(
+        frame_cols,
+        text="Одинаковые ссылки и фото скачивать один раз (остальные — ссылки на файл или копии)",
+        variable=var_dedupe
+    ).grid(row=8, column=0, columnspan=4, sticky="w")
+
+    tk.Label(frame_cols, text="Сохранять как:").grid(row=9, column=0, sticky="e")
+    combo_save_format = ttk.Combobox(frame_cols, values=["как есть", "jpg", "png", "webp"], width=10, state="readonly")
+    combo_save_format.current(0)
+    combo_save_format.grid(row=9, column=1, padx=5, sticky="w")
+
+    tk.Label(frame_cols, text="Попыток на фото:").grid(row=9, column=2, sticky="e")
+    entry_attempts = tk.Entry(frame_cols, width=5)
+    entry_attempts.insert(0, str(RETRY_ATTEMPTS))
+    entry_attempts.grid(row=9, column=3, padx=5, sticky="ew")
+
+    var_run_log = tk.BooleanVar(value=True)
+    tk.Checkbutton(
+        frame_cols,
+        text=f"Журнал запуска (JSONL/CSV и итог) в папке {RUN_LOG_FOLDER}",
+        variable=var_run_log
+    ).grid(row=10, column=0, columnspan=4, sticky="w")
+
+    var_skip_existing = tk.BooleanVar(value=False)
+    tk.Checkbutton(
+        frame_cols,
+        text="Не скачивать фото, которые уже есть в папке",
+        variable=var_skip_existing
+    ).grid(row=11, column=0, columnspan=2, sticky="w")
+    tk.Label(frame_cols, text="Проверять файлы:").grid(row=11, column=2, sticky="e")
+    combo_verify_existing = ttk.Combobox(frame_cols, values=list(GUI_EXISTING_CHECKS), width=12, state="readonly")
+    combo_verify_existing.current(0)
+    combo_verify_existing.grid(row=11, column=3, padx=5, sticky="w")
+
+    tk.Label(frame_cols, text="Проверять скачанные:").grid(row=12, column=0, sticky="e")
+    combo_validate = ttk.Combobox(frame_cols, values=list(GUI_PAYLOAD_CHECKS), width=16, state="readonly")
+    combo_validate.current(0)
+    combo_validate.grid(row=12, column=1, padx=5, sticky="w")
+    tk.Label(frame_cols, text=f"не-фото откладываются в {QUARANTINE_FOLDER} и скачиваются повторно",
+             fg="gray").grid(row=12, column=2, columnspan=2, sticky="w")
+
+    # Кнопка скачивания
+    frame_start = tk.Frame(root)
+    frame_start.pack(pady=10)
+    btn_start = tk.Button(frame_start, text="Начать скачивание", command=start_download, bg="green", fg="white")
+    btn_start.pack(side="left", padx=5)
+    btn_plan = tk.Button(frame_start, text="План загрузки", command=show_download_plan)
+    btn_plan.pack(side="left", padx=5)
+
+    # Конвертор изображений
+    frame_convert = tk.LabelFrame(root, text="Конвертор формата фотографий")
+    frame_convert.pack(pady=10, fill="x", padx=5)
+    frame_convert.columnconfigure(1, weight=1)
+
+    tk.Label(frame_convert, text="Папка с изображениями:").grid(row=0, column=0, sticky="e")
+    entry_convert_folder = tk.Entry(frame_convert, width=70)
+    entry_convert_folder.grid(row=0, column=1, padx=5, sticky="ew")
+    btn_browse_folder = tk.Button(frame_convert, text="Обзор", command=lambda: browse_folder(entry_convert_folder))
+    btn_browse_folder.grid(row=0, column=2, padx=2)
+
+    tk.Label(frame_convert, text="Формат:").grid(row=1, column=0, sticky="e")
+    combo_format = ttk.Combobox(frame_convert, values=["png", "jpg", "webp"], width=10)
+    combo_format.current(0)
+    combo_format.grid(row=1, column=1, sticky="w", padx=5)
+
+    tk.Label(frame_convert, text="Процессов:").grid(row=4, column=0, sticky="e")
+    entry_convert_workers = tk.Entry(frame_convert, width=5)
+    entry_convert_workers.insert(0, str(os.cpu_count() or 1))
+    entry_convert_workers.grid(row=4, column=1, padx=5, sticky="w")
+
+    var_convert_incremental = tk.BooleanVar(value=True)
+    tk.Checkbutton(
+        frame_convert,
+        text="Только новые и изменённые файлы",
+        variable=var_convert_incremental
+    ).grid(row=5, column=1, sticky="w")
+    var_convert_hash_index = tk.BooleanVar(value=False)
+    tk.Checkbutton(
+        frame_convert,
+        text="Сверять содержимое (индекс в папке)",
+        variable=var_convert_hash_index
+    ).grid(row=5, column=2, sticky="w")
+
+    tk.Label(frame_convert, text="Размеры превью:").grid(row=6, column=0, sticky="e")
+    entry_rendition_sizes = tk.Entry(frame_convert, width=40)
+    entry_rendition_sizes.insert(0, ", ".join(_rendition_folder(size) for size in RENDITION_SIZES))
+    entry_rendition_sizes.grid(row=6, column=1, padx=5, sticky="w")
+    btn_renditions = tk.Button(frame_convert, text="Сделать превью", command=start_renditions, bg="teal", fg="white")
+    btn_renditions.grid(row=6, column=2, padx=5, sticky="w")
+
+    btn_convert = tk.Button(frame_convert, text="Конвертировать", command=start_conversion, bg="orange", fg="white")
+    btn_convert.grid(row=2, column=1, pady=5, sticky="w")
+
+    btn_delete = tk.Button(frame_convert, text="Удалить все файлы формата", command=delete_files_of_format, bg="red", fg="white")
+    btn_delete.grid(row=2, column=2, padx=5, sticky="w")
+
+    btn_group = tk.Button(
+        frame_convert,
+        text="Сгруппировать фото",
+        command=start_grouping,
+        bg="purple",
+        fg="white"
+    )
+
+    btn_group.grid(row=3, column=1, pady=5, sticky="w")
+
+    btn_folder_plan = tk.Button(frame_convert, text="План (конвертация, удаление, группировка)",
+                                command=show_folder_plan)
+    btn_folder_plan.grid(row=3, column=2, padx=5, sticky="w")
+
+    # Прогресс
+    progress_bar = ttk.Progressbar(
+        root,
+        length=700,
+        maximum=100
+    )
+    progress_bar.pack(pady=5, fill="x", padx=5)
+    lbl_progress = tk.Label(root, text="0%")
+    lbl_progress.pack()
+    lbl_metrics = tk.Label(root, text="", fg="gray")
+    lbl_metrics.pack()
+
+    # Лог
+    text_log = scrolledtext.ScrolledText(root, width=110, height=20)
+    text_log.pack(pady=10, fill="both", expand=True)
+
+    # Подпись внизу
+    frame_footer = tk.Frame(root)
+    frame_footer.pack(fill="x", pady=5, padx=10)
+    frame_footer.columnconfigure(0, weight=1)
+    frame_footer.columnconfigure(1, weight=1)
+
+    lbl_left = tk.Label(frame_footer, text="Программа от Three_Per_Cento", fg="blue", cursor="hand2")
+    lbl_left.grid(row=0, column=0, sticky="w")
+    lbl_left.bind("<Button-1>", lambda e: open_link("https://github.com/ThreePerCento"))
+
+    lbl_right = tk.Label(frame_footer, text="GitHub program", fg="blue", cursor="hand2")
+    lbl_right.grid(row=0, column=1, sticky="e")
+    lbl_right.bind("<Button-1>", lambda e: open_link("https://github.com/ThreePerCento/Photo_downloader_from_links_to_Excel/releases"))
+
+    root.after(GUI_POLL_MS, drain_gui_events)
+    root.mainloop()
 
 
@@ -0,0 +1,15 @@
+import importlib.util
+import os
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "import_photos (v6).py")
+
+
+def load_module():
+    # в имени файла пробел и скобки — обычный import не подходит
+    spec = importlib.util.spec_from_file_location("import_photos_v6", SOURCE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+ip = load_module()
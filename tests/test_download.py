@@ -0,0 +1,135 @@
+import io
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import openpyxl
+from PIL import Image
+
+from conftest import ip
+
+
+def jpeg(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 24), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # путь -> список ответов (status, content_type, body); последний повторяется
+    routes = {}
+    hits = {}
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        attempt = self.hits.get(path, 0)
+        self.hits[path] = attempt + 1
+        responses = self.routes.get(path, [(404, "text/plain", b"not found")])
+        status, content_type, body = responses[min(attempt, len(responses) - 1)]
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadTest(unittest.TestCase):
+    """Загрузка с локального HTTP-сервера, как в benchmark_backends."""
+
+    backend = "threads"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Handler.routes.clear()
+        Handler.hits.clear()
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.excel_path = os.path.join(self.folder.name, "photos.xlsx")
+
+    def route(self, path, *responses):
+        Handler.routes[path] = list(responses)
+        return self.base + path
+
+    def download(self, rows, **kwargs):
+        wb = openpyxl.Workbook()
+        for row in rows:
+            wb.active.append(row)
+        wb.save(self.excel_path)
+        logs = []
+        columns = list(range(1, max(len(row) for row in rows)))
+        ip.download_photos(self.excel_path, 0, columns, lambda done, total: None, logs.append,
+                           delay_seconds=0, run_log=False, backend=self.backend,
+                           retry_policy=ip.RetryPolicy(backoff=0.01), **kwargs)
+        return logs
+
+    def listdir(self, *parts):
+        path = os.path.join(self.folder.name, *parts)
+        return sorted(os.listdir(path)) if os.path.isdir(path) else []
+
+    def test_downloads_every_photo(self):
+        urls = [self.route(f"/{n}.jpg", (200, "image/jpeg", jpeg((n * 40, 0, 0)))) for n in range(3)]
+        self.download([["A", urls[0], urls[1]], ["B", urls[2]]])
+        self.assertEqual(self.listdir("A"), ["A_1.jpg", "A_2.jpg"])
+        self.assertEqual(self.listdir("B"), ["B_1.jpg"])
+        with Image.open(os.path.join(self.folder.name, "B", "B_1.jpg")) as img:
+            self.assertEqual(img.size, (32, 24))
+
+    def test_resume_skips_finished_rows(self):
+        url = self.route("/a.jpg", (200, "image/jpeg", jpeg((0, 0, 0))))
+        self.download([["A", url]])
+        logs = self.download([["A", url]])
+        self.assertEqual(Handler.hits["/a.jpg"], 1)
+        self.assertIn("⏭ Уже скачано в прошлый раз: 1 из 1", logs)
+
+    def test_temporary_error_is_retried(self):
+        url = self.route("/a.jpg", (502, "text/plain", b"bad gateway"), (200, "image/jpeg", jpeg((0, 0, 0))))
+        self.download([["A", url]])
+        self.assertEqual(Handler.hits["/a.jpg"], 2)
+        self.assertEqual(self.listdir("A"), ["A_1.jpg"])
+
+    def test_duplicate_link_is_requested_once(self):
+        url = self.route("/a.jpg", (200, "image/jpeg", jpeg((0, 0, 0))))
+        self.download([["A", url], ["B", url]])
+        self.assertEqual(Handler.hits["/a.jpg"], 1)
+        self.assertEqual(self.listdir("A"), ["A_1.jpg"])
+        self.assertEqual(self.listdir("B"), ["B_1.jpg"])
+
+    def test_page_instead_of_photo_is_quarantined(self):
+        url = self.route("/a.jpg", (200, "text/html", b"<html>captcha</html>"))
+        self.download([["A", url]])
+        self.assertEqual(self.listdir("A"), [])
+        self.assertEqual(self.listdir(ip.QUARANTINE_FOLDER), ["A_1.jpg.bad"])
+        # страница — возможно, блокировка: повторяется
+        self.assertEqual(Handler.hits["/a.jpg"], ip.RETRY_ATTEMPTS)
+
+    def test_unknown_format_is_not_retried(self):
+        url = self.route("/a.jpg", (200, "image/jpeg", b"\x00\x01 not an image" * 8))
+        self.download([["A", url]])
+        self.assertEqual(Handler.hits["/a.jpg"], 1)
+        self.assertEqual(self.listdir(ip.QUARANTINE_FOLDER), ["A_1.jpg.bad"])
+
+
+@unittest.skipIf(ip.httpx is None, "httpx не установлен")
+class AsyncDownloadTest(DownloadTest):
+    backend = "async"
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from conftest import ip
+
+
+class FolderOperationsTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.root = self.folder.name
+
+    def photo(self, *parts, fmt="PNG"):
+        path = os.path.join(self.root, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Image.new("RGB", (16, 16), (200, 0, 0)).save(path, fmt)
+        return path
+
+    def test_group_moves_photos_to_root_with_unique_names(self):
+        self.photo("a", "p.png")
+        self.photo("b", "p.png")
+        self.photo("b", "c", "q.png")
+        ip.group_photos(self.root, lambda msg: None)
+        names = sorted(name for name in os.listdir(self.root) if name.endswith(".png"))
+        self.assertEqual(names, ["p.png", "p_1.png", "q.png"])
+        self.assertEqual(os.listdir(os.path.join(self.root, "a")), [])
+
+    def test_group_skips_rendition_folders_but_not_article_folders_named_like_sizes(self):
+        self.photo("30x40", "p.png")
+        self.photo("a", "q.png")
+        rendition = self.photo("a", "200x200", "q.png")
+        open(os.path.join(os.path.dirname(rendition), ip.RENDITION_MARKER), "w").close()
+        ip.group_photos(self.root, lambda msg: None)
+        self.assertTrue(os.path.exists(os.path.join(self.root, "p.png")))
+        self.assertTrue(os.path.exists(os.path.join(self.root, "q.png")))
+        self.assertTrue(os.path.exists(rendition))
+
+    def test_delete_removes_only_target_format(self):
+        png = self.photo("a", "p.png")
+        jpg = self.photo("a", "p.jpg", fmt="JPEG")
+        ip._delete_files_worker(self.root, "png", lambda msg: None, lambda done, total: None)
+        self.assertFalse(os.path.exists(png))
+        self.assertTrue(os.path.exists(jpg))
+
+    def test_incremental_convert_picks_up_rewritten_source(self):
+        source = self.photo("a", "p.png")
+        ip.convert_images_recursive(self.root, "jpg", lambda msg: None, lambda done, total: None, workers=1)
+        target = os.path.join(self.root, "a", "p.jpg")
+        first = os.stat(target).st_mtime_ns
+        # исходник перезаписан на месте: mtime папки не меняется
+        stat = os.stat(source)
+        Image.new("RGB", (16, 16), (0, 0, 200)).save(source, "PNG")
+        os.utime(source, ns=(stat.st_atime_ns, first + 10 ** 9))
+        ip.convert_images_recursive(self.root, "jpg", lambda msg: None, lambda done, total: None, workers=1)
+        with Image.open(target) as img:
+            self.assertGreater(img.getpixel((8, 8))[2], 150)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from conftest import ip
+
+
+class HostRateLimiterTest(unittest.TestCase):
+    def test_unlimited_host_is_not_delayed(self):
+        limiter = ip.HostRateLimiter(delay_seconds=3)
+        self.assertEqual(limiter.wait_time("a"), 0.0)
+        self.assertIsNone(limiter.feedback("a", 200))
+
+    def test_first_block_slows_host_to_delay(self):
+        limiter = ip.HostRateLimiter(delay_seconds=3)
+        pause = limiter.feedback("a", 429)
+        self.assertAlmostEqual(pause, 3.0)
+        self.assertGreater(limiter.wait_time("a"), 2.0)
+        self.assertEqual(limiter.wait_time("b"), 0.0)
+
+    def test_first_block_with_slow_base_rate(self):
+        # base_rate ниже 1/delay: до первой блокировки throttled_at еще не задан
+        limiter = ip.HostRateLimiter(delay_seconds=3, base_rate=0.3)
+        pause = limiter.feedback("a", 429)
+        self.assertAlmostEqual(pause, 1 / 0.15)
+
+    def test_simultaneous_blocks_count_once(self):
+        limiter = ip.HostRateLimiter(delay_seconds=3)
+        limiter.feedback("a", 429)
+        self.assertAlmostEqual(limiter.feedback("a", 503), 3.0)
+
+    def test_retry_after_extends_pause(self):
+        limiter = ip.HostRateLimiter(delay_seconds=3)
+        self.assertAlmostEqual(limiter.feedback("a", 429, retry_after=20), 20.0)
+        self.assertAlmostEqual(limiter.feedback("b", 429, retry_after=10 ** 6), ip.MAX_RETRY_AFTER)
+
+    def test_success_streak_restores_base_rate(self):
+        limiter = ip.HostRateLimiter(delay_seconds=1, base_rate=None)
+        limiter.feedback("a", 429)
+        for _ in range(ip.RAMP_UP_AFTER * 20):
+            limiter.feedback("a", 200)
+        self.assertIsNone(limiter._hosts["a"]["rate"])
+
+    def test_errors_do_not_ramp_up(self):
+        limiter = ip.HostRateLimiter(delay_seconds=1)
+        limiter.feedback("a", 429)
+        for _ in range(ip.RAMP_UP_AFTER * 2):
+            limiter.feedback("a", 404)
+        self.assertAlmostEqual(limiter._hosts["a"]["rate"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from conftest import ip
+
+
+def task(host, n):
+    return ip.PhotoTask(f"https://{host}/{n}.jpg", f"{n}.jpg", host)
+
+
+def drain(scheduler):
+    tasks = []
+    while True:
+        next_task = scheduler.next_task()
+        if next_task is None:
+            return tasks
+        tasks.append(next_task)
+
+
+class HostSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = ip.HostScheduler(per_host_limit=2)
+        for n in range(10):
+            self.scheduler.add(task("a", n))
+            self.scheduler.add(task("b", n))
+
+    def test_per_host_limit(self):
+        hosts = [t.host for t in drain(self.scheduler)]
+        self.assertEqual(sorted(hosts), ["a", "a", "b", "b"])
+
+    def test_raised_limit_applies_to_one_host(self):
+        self.scheduler.set_limit("a", 5)
+        hosts = [t.host for t in drain(self.scheduler)]
+        self.assertEqual(hosts.count("a"), 5)
+        self.assertEqual(hosts.count("b"), 2)
+        self.assertEqual(self.scheduler.limit("b"), 2)
+
+    def test_release_frees_a_slot(self):
+        first = drain(self.scheduler)
+        self.scheduler.release(first[0])
+        self.assertEqual(self.scheduler.next_task().host, first[0].host)
+        self.assertIsNone(self.scheduler.next_task())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import re
+import tempfile
+import unittest
+import zipfile
+
+import openpyxl
+
+from conftest import ip
+
+
+class IterExcelRowsTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def workbook(self, name, dimension=None):
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(["A0", "u0"])
+        ws.append([])
+        ws.append(["A2", None, "u2"])
+        path = os.path.join(self.folder.name, name)
+        wb.save(path)
+        if dimension is not None:
+            # так пишут размер листа некоторые выгрузки: устаревший, на одну ячейку
+            stale = path + ".stale"
+            with zipfile.ZipFile(path) as zin, zipfile.ZipFile(stale, "w") as zout:
+                for item in zin.infolist():
+                    data = zin.read(item.filename)
+                    if item.filename == "xl/worksheets/sheet1.xml":
+                        data = re.sub(rb'<dimension ref="[^"]*"\s*/>', dimension, data)
+                    zout.writestr(item, data)
+            os.replace(stale, path)
+        return path
+
+    def rows(self, path):
+        return [(idx, tuple(values)) for idx, values in ip.iter_excel_rows(path)]
+
+    def test_reads_all_rows(self):
+        rows = self.rows(self.workbook("t.xlsx"))
+        self.assertEqual([idx for idx, _ in rows], [0, 1, 2])
+        self.assertEqual(rows[2][1][:3], ("A2", None, "u2"))
+
+    def test_stale_dimension(self):
+        rows = self.rows(self.workbook("t.xlsx", b'<dimension ref="A1"/>'))
+        self.assertEqual([idx for idx, _ in rows], [0, 1, 2])
+        self.assertEqual(rows[0][1][:2], ("A0", "u0"))
+        self.assertEqual(rows[2][1][:3], ("A2", None, "u2"))
+
+
+if __name__ == "__main__":
+    unittest.main()